@@ -124,7 +124,7 @@ class MainProcessor:
         if ext in ["doc", "docx"]:
             return await self.doc_parser.process(file_path)
         elif ext == "xlsx":
-            return self.xlsx_parser.parse(file_path)
+            return await self.xlsx_parser.parse_async(file_path)
         else:
             raise ValueError(f"不支持的文档格式: {ext}")
 
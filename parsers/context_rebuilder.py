@@ -2,7 +2,7 @@
 上下文重构器，负责为分片chunk重构上下文信息
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict
 from utils.logger import logger
 
 
@@ -33,18 +33,17 @@ class ContextRebuilder:
     
     def _get_original_paragraph_context(self, paragraph_index: int, all_chunks: List[dict]) -> str:
         """获取原始段落的上下文"""
-        # 查找原始段落chunk
-        original_chunk = None
-        for chunk in all_chunks:
-            if (chunk.get("metadata", {}).get("paragraph_index") == paragraph_index and 
-                not chunk.get("metadata", {}).get("is_fragment")):
-                original_chunk = chunk
-                break
-        
-        if original_chunk:
-            return original_chunk.get("context", "")
-        
-        return ""
+        # 查找原始段落chunk（next + 生成器，命中即停止）
+        original_chunk = next(
+            (
+                chunk for chunk in all_chunks
+                if chunk.get("metadata", {}).get("paragraph_index") == paragraph_index
+                and not chunk.get("metadata", {}).get("is_fragment")
+            ),
+            None,
+        )
+
+        return original_chunk.get("context", "") if original_chunk else ""
     
     def _get_sibling_fragments_info(self, fragment_chunk: dict, all_chunks: List[dict], position_mapper) -> str:
         """获取同段落其他分片的信息"""
@@ -77,32 +76,34 @@ class ContextRebuilder:
     
     def update_table_context_for_fragments(self, table_chunks: List[dict], all_chunks: List[dict], position_mapper) -> None:
         """更新表格上下文以适配分片"""
+        # 一次性建立段落索引，各表格共享
+        paragraph_chunks = self._build_paragraph_index(all_chunks)
         for table_chunk in table_chunks:
-            preceding_idx = table_chunk.get("metadata", {}).get("preceding_paragraph_index")
-            following_idx = table_chunk.get("metadata", {}).get("following_paragraph_index")
-            
-            # 查找分片后的相关段落
-            preceding_fragments = self._find_paragraph_fragments(all_chunks, preceding_idx)
-            following_fragments = self._find_paragraph_fragments(all_chunks, following_idx)
-            
-            # 更新表格上下文
-            table_chunk["context"] = self._build_table_context_with_fragments(
-                preceding_fragments, following_fragments
-            )
-    
-    def _find_paragraph_fragments(self, all_chunks: List[dict], paragraph_index: Optional[int]) -> List[dict]:
-        """查找指定段落的所有分片"""
-        if not paragraph_index:
-            return []
-        
-        fragments = []
+            self._update_table_context(table_chunk, paragraph_chunks)
+
+    def _update_table_context(self, table_chunk: dict, paragraph_chunks: Dict[int, List[dict]]) -> None:
+        """根据段落索引更新单个表格的上下文"""
+        preceding_idx = table_chunk.get("metadata", {}).get("preceding_paragraph_index")
+        following_idx = table_chunk.get("metadata", {}).get("following_paragraph_index")
+
+        # 查找分片后的相关段落
+        preceding_fragments = paragraph_chunks.get(preceding_idx, []) if preceding_idx else []
+        following_fragments = paragraph_chunks.get(following_idx, []) if following_idx else []
+
+        # 更新表格上下文
+        table_chunk["context"] = self._build_table_context_with_fragments(
+            preceding_fragments, following_fragments
+        )
+
+    def _build_paragraph_index(self, all_chunks: List[dict]) -> Dict[int, List[dict]]:
+        """构建 段落索引 -> chunks 的映射，保持原始顺序"""
+        paragraph_chunks: Dict[int, List[dict]] = {}
         for chunk in all_chunks:
-            chunk_metadata = chunk.get("metadata", {})
-            if chunk_metadata.get("paragraph_index") == paragraph_index:
-                fragments.append(chunk)
-        
-        return fragments
-    
+            para_idx = chunk.get("metadata", {}).get("paragraph_index")
+            if para_idx:
+                paragraph_chunks.setdefault(para_idx, []).append(chunk)
+        return paragraph_chunks
+
     def _build_table_context_with_fragments(self, preceding_fragments: List[dict], following_fragments: List[dict]) -> str:
         """构建包含分片的表格上下文"""
         preceding_content = ""
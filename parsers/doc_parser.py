@@ -3,21 +3,64 @@ DOC/DOCX文件解析器实现（docx用python-docx，doc用LibreOffice转换）
 """
 
 import os
+import atexit
+import functools
+import hashlib
+import json
+import pathlib
+import queue
+import re
+import shutil
+import socket
+import string
 import subprocess
+import sys
 import tempfile
+import threading
+import time
 import platform
-from typing import List, Dict, Optional, Tuple
+import logging
+import multiprocessing
+import weakref
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from utils.logger import logger
 
+from docx import Document
+from lxml import etree
 from docx.table import Table
 from docx.text.paragraph import Paragraph
 from dotenv import load_dotenv
 import asyncio
-from utils.zhipu_client import zhipu_complete_async, parse_json_response
-from utils.chunk_prompts import SYSTEM_PROMPTS, STRUCTURED_PROMPTS
-from utils.config import LLM_CONFIG
+from utils.zhipu_client import (
+    zhipu_complete_async,
+    parse_json_response,
+    parse_json_array_response,
+)
+from utils.chunk_prompts import (
+    BATCH_STRUCTURED_PROMPT,
+    BATCH_SYSTEM_PROMPT,
+    SYSTEM_PROMPTS,
+    STRUCTURED_PROMPTS,
+    STRUCTURED_PROMPTS_WITH_CONTEXT,
+)
+from utils.config import LLM_CONFIG, LIBREOFFICE_CONFIG, DOC_PARSER_CONFIG
 from .fragment_manager import FragmentManager
 from .fragment_config import FragmentConfig, TableProcessingConfig
+from utils.config_manager import ConfigManager
+
+# 图片处理组件在模块加载时导入一次，缺少依赖时禁用图片处理
+try:
+    from .image_processing.image_extractor import ImageExtractor
+    from .image_processing.context_collector import ContextCollector
+    from .image_processing.image_analyzer import ImageAnalyzer
+    from utils.zhipu_client import VisionModelClient
+except ImportError as _image_import_error:
+    ImageExtractor = ContextCollector = ImageAnalyzer = VisionModelClient = None
+    logger.debug(f"图片处理组件导入失败: {_image_import_error}")
 
 
 class LibreOfficeNotFoundError(Exception):
@@ -38,8 +81,9 @@ class ConversionTimeoutError(Exception):
     pass
 
 
-def check_libreoffice_installation() -> bool:
-    """检测LibreOffice是否已安装"""
+@functools.lru_cache(maxsize=1)
+def find_libreoffice_command() -> Optional[str]:
+    """探测LibreOffice命令路径，未安装时返回None（结果在进程生命周期内缓存）"""
     system = platform.system().lower()
 
     if system == "windows":
@@ -50,69 +94,456 @@ def check_libreoffice_installation() -> bool:
         ]
         for path in possible_paths:
             if os.path.exists(path):
-                return True
-        return False
+                return path
+        logger.warning("Windows系统未找到LibreOffice安装")
+        return None
     else:
-        # Linux/macOS使用which命令检查
-        try:
-            result = subprocess.run(
-                ["which", "libreoffice"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=10,
-            )
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            return False
+        # Linux/macOS在PATH中查找命令（shutil.which，无需启动which子进程）
+        libreoffice_cmd = shutil.which("libreoffice") or shutil.which("soffice")
+        if libreoffice_cmd is None:
+            logger.warning("系统未找到libreoffice命令")
+        return libreoffice_cmd
+
+
+def _invalidate_libreoffice_cache() -> None:
+    """清除缓存的LibreOffice探测结果（安装状态变化后或测试中重新探测）"""
+    find_libreoffice_command.cache_clear()
+
+
+def check_libreoffice_installation() -> bool:
+    """检测LibreOffice是否已安装"""
+    return find_libreoffice_command() is not None
 
 
 def get_libreoffice_command() -> str:
     """获取LibreOffice命令路径"""
-    system = platform.system().lower()
+    libreoffice_cmd = find_libreoffice_command()
+    if libreoffice_cmd is None:
+        raise LibreOfficeNotFoundError("系统未找到LibreOffice命令")
+    return libreoffice_cmd
 
-    if system == "windows":
-        possible_paths = [
-            r"C:\Program Files\LibreOffice\program\soffice.exe",
-            r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
-        ]
-        for path in possible_paths:
-            if os.path.exists(path):
-                return path
-        raise LibreOfficeNotFoundError("Windows系统未找到LibreOffice安装")
-    else:
-        # Linux/macOS
-        try:
-            result = subprocess.run(
-                ["which", "libreoffice"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=10,
+
+# 单个DOC文件的转换超时时间（秒）
+CONVERSION_TIMEOUT = 60
+
+
+class LibreOfficeService:
+    """常驻LibreOffice监听进程池，通过unoconv复用已启动的soffice完成转换，避免每个DOC冷启动"""
+
+    _instance: Optional["LibreOfficeService"] = None
+    _unavailable = False
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self, soffice_cmd: str, unoconv_cmd: str, pool_size: int, base_port: int
+    ):
+        self.soffice_cmd = soffice_cmd
+        self.unoconv_cmd = unoconv_cmd
+        self.pool_size = max(1, pool_size)
+        self.base_port = base_port
+        # 实际使用的端口在 start() 中从 base_port 起选取当前空闲的端口
+        self.ports: List[int] = []
+        # 空闲监听端口队列，同一监听进程同一时刻只处理一个转换
+        self._idle_ports: "queue.Queue[int]" = queue.Queue()
+        # 服务为进程级单例，可能被多个事件循环使用（如同步接口中的asyncio.run），
+        # 每个事件循环各持有一个容量为 pool_size 的信号量来等待空闲端口
+        self._loop_semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+        self._processes: List[subprocess.Popen] = []
+        self._profile_dirs: List[str] = []
+
+    @classmethod
+    def get_instance(cls) -> Optional["LibreOfficeService"]:
+        """获取全局监听服务；未启用、缺少unoconv或启动失败时返回None（回退为逐个冷启动）"""
+        if cls._instance is not None:
+            return cls._instance
+        if cls._unavailable or not LIBREOFFICE_CONFIG["listener_enabled"]:
+            return None
+
+        with cls._instance_lock:
+            if cls._instance is None and not cls._unavailable:
+                unoconv_cmd = shutil.which("unoconv")
+                if unoconv_cmd is None:
+                    logger.info("未找到unoconv，DOC转换将逐个启动LibreOffice")
+                    cls._unavailable = True
+                    return None
+                service = cls(
+                    get_libreoffice_command(),
+                    unoconv_cmd,
+                    LIBREOFFICE_CONFIG["pool_size"],
+                    LIBREOFFICE_CONFIG["base_port"],
+                )
+                try:
+                    service.start()
+                except Exception as e:
+                    logger.warning(f"LibreOffice监听进程启动失败，回退为逐个启动: {str(e)}")
+                    service.shutdown()
+                    cls._unavailable = True
+                    return None
+                atexit.register(service.shutdown)
+                cls._instance = service
+        return cls._instance
+
+    def start(self) -> None:
+        """
+        为每个端口启动一个soffice监听进程，并等待端口可连接。
+        跳过已被其他进程（如另一个TableParser实例的监听进程）占用的端口，
+        且监听进程退出时立即报错，避免把转换请求发给不属于本实例的监听进程
+        """
+        self.ports = _allocate_free_ports(self.base_port, self.pool_size)
+        for port in self.ports:
+            # 多个soffice实例必须使用独立的用户配置目录
+            profile_dir = tempfile.mkdtemp(prefix="lo_profile_")
+            self._profile_dirs.append(profile_dir)
+            process = subprocess.Popen(
+                [
+                    self.soffice_cmd,
+                    "--headless",
+                    "--invisible",
+                    "--nologo",
+                    "--norestore",
+                    f"-env:UserInstallation={pathlib.Path(profile_dir).as_uri()}",
+                    f"--accept=socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext",
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
             )
-            if result.returncode == 0:
-                return "libreoffice"
-            raise LibreOfficeNotFoundError("系统未找到libreoffice命令")
-        except subprocess.TimeoutExpired:
-            raise LibreOfficeNotFoundError("检测libreoffice命令超时")
+            self._processes.append(process)
+
+        deadline = time.monotonic() + LIBREOFFICE_CONFIG["startup_timeout"]
+        for port, process in zip(self.ports, self._processes):
+            while True:
+                if process.poll() is not None:
+                    raise ConversionError(
+                        f"LibreOffice监听进程已退出（端口{port}，返回码{process.returncode}）"
+                    )
+                try:
+                    with socket.create_connection(("127.0.0.1", port), timeout=1):
+                        break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise ConversionTimeoutError(
+                            f"LibreOffice监听进程启动超时（端口{port}）"
+                        )
+                    time.sleep(0.2)
+            self._idle_ports.put(port)
+        logger.info(f"LibreOffice监听进程已启动，端口: {self.ports}")
+
+    async def convert(
+        self, doc_paths: List[str], output_dir: str, timeout: int
+    ) -> Optional[subprocess.CompletedProcess]:
+        """
+        借用一个空闲监听进程执行转换（支持一次转换多个文件）。
+        其他事件循环占满全部监听进程时返回None，由调用方回退为冷启动转换
+        """
+        # 在事件循环内等待空闲端口，不占用线程池线程
+        async with self._get_loop_semaphore():
+            try:
+                port = self._idle_ports.get_nowait()
+            except queue.Empty:
+                return None
+            try:
+                return await _run_subprocess_async(
+                    [
+                        self.unoconv_cmd,
+                        "--connection",
+                        f"socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext",
+                        "--format",
+                        "docx",
+                        "--output",
+                        output_dir + os.sep,
+                        *doc_paths,
+                    ],
+                    timeout,
+                )
+            finally:
+                self._idle_ports.put(port)
+
+    def _get_loop_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环对应的端口信号量"""
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._loop_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(len(self.ports))
+                self._loop_semaphores[loop] = semaphore
+        return semaphore
+
+    def shutdown(self) -> None:
+        """终止所有监听进程并清理配置目录"""
+        for process in self._processes:
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        self._processes.clear()
+        for profile_dir in self._profile_dirs:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        self._profile_dirs.clear()
 
 
-def convert_doc_to_docx(doc_path: str, output_dir: Optional[str] = None) -> str:
-    """使用LibreOffice将DOC文件转换为DOCX格式"""
-    if not os.path.exists(doc_path):
-        raise FileNotFoundError(f"DOC文件不存在: {doc_path}")
+# 从 base_port 起查找空闲端口时最多尝试的端口数
+_PORT_SEARCH_LIMIT = 100
 
-    # 检查LibreOffice安装
-    if not check_libreoffice_installation():
+
+def _allocate_free_ports(base_port: int, count: int) -> List[int]:
+    """从 base_port 起依次选取 count 个当前可绑定的本机端口"""
+    ports = []
+    for port in range(base_port, base_port + _PORT_SEARCH_LIMIT):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            try:
+                probe.bind(("127.0.0.1", port))
+            except OSError:
+                continue
+        ports.append(port)
+        if len(ports) == count:
+            return ports
+    raise ConversionError(
+        f"端口 {base_port}-{base_port + _PORT_SEARCH_LIMIT - 1} 中没有足够的空闲端口"
+    )
+
+
+async def _run_subprocess_async(
+    cmd: List[str], timeout: float
+) -> subprocess.CompletedProcess:
+    """异步执行子进程，超时时终止进程并抛出subprocess.TimeoutExpired"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def convert_doc_to_docx(
+    doc_path: str, output_dir: Optional[str] = None, return_bytes: bool = False
+) -> Union[str, bytes]:
+    """
+    使用LibreOffice将DOC文件转换为DOCX格式（同步接口，不可在事件循环中调用）。
+    return_bytes为True时返回DOCX内容并清理临时转换文件。
+    """
+    docx_path = convert_docs_to_docx([doc_path], output_dir).get(doc_path)
+    if docx_path is None:
+        raise ConversionError(f"转换后的DOCX文件不存在: {doc_path}")
+    return _read_converted_docx(docx_path) if return_bytes else docx_path
+
+
+def _read_converted_docx(docx_path: str) -> bytes:
+    """读取转换得到的DOCX内容，非缓存文件读取后立即删除（目录为空时一并删除）"""
+    with open(docx_path, "rb") as f:
+        data = f.read()
+    if not _is_cached_conversion(docx_path):
+        try:
+            os.remove(docx_path)
+        except OSError as e:
+            logger.warning(f"清理临时文件失败: {str(e)}")
+        else:
+            # 直接尝试删除目录，目录非空时 rmdir 失败即保留，无需先列目录
+            try:
+                os.rmdir(os.path.dirname(docx_path))
+            except OSError:
+                pass
+    return data
+
+
+def convert_docs_to_docx(
+    doc_paths: List[str], output_dir: Optional[str] = None
+) -> Dict[str, str]:
+    """批量转换DOC文件的同步接口，不可在事件循环中调用"""
+    return asyncio.run(convert_docs_to_docx_async(doc_paths, output_dir))
+
+
+async def convert_docs_to_docx_async(
+    doc_paths: List[str], output_dir: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    一次LibreOffice调用批量转换多个DOC文件，摊薄进程启动开销。
+    返回 {doc_path: docx_path}，转换失败的文件不出现在结果中。
+    未指定output_dir时优先使用按内容哈希缓存的转换结果。
+    """
+    # 一次stat同时校验文件存在并取得缓存键所需的大小与修改时间
+    doc_stats: Dict[str, os.stat_result] = {}
+    for doc_path in doc_paths:
+        try:
+            doc_stats[doc_path] = os.stat(doc_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"DOC文件不存在: {doc_path}")
+
+    loop = asyncio.get_running_loop()
+    results: Dict[str, str] = {}
+    cache_paths: Dict[str, str] = {}
+    use_cache = output_dir is None and LIBREOFFICE_CONFIG["cache_enabled"]
+    if use_cache:
+        # 计算内容哈希需要读取整个文件，放到线程池中执行
+        for doc_path in dict.fromkeys(doc_paths):
+            cache_path = await loop.run_in_executor(
+                None, _conversion_cache_path, doc_path, doc_stats[doc_path]
+            )
+            try:
+                # 刷新修改时间（作为LRU淘汰依据），同时判断缓存是否存在
+                os.utime(cache_path)
+            except FileNotFoundError:
+                cache_paths[doc_path] = cache_path
+                continue
+            logger.info(f"命中DOC转换缓存: {doc_path} -> {cache_path}")
+            results[doc_path] = cache_path
+        pending = list(cache_paths)
+        if not pending:
+            return results
+    else:
+        pending = list(dict.fromkeys(doc_paths))
+
+    # 检查LibreOffice安装并获取命令路径（一次探测）
+    libreoffice_cmd = find_libreoffice_command()
+    if libreoffice_cmd is None:
         raise LibreOfficeNotFoundError("系统未安装LibreOffice，无法转换DOC文件")
 
     # 获取输出目录
     if output_dir is None:
-        output_dir = tempfile.mkdtemp(prefix="doc_conversion_")
+        # 转换结果需移入磁盘上的缓存目录时不使用内存文件系统（os.replace 不能跨文件系统）
+        output_dir = tempfile.mkdtemp(
+            prefix="doc_conversion_",
+            dir=None if use_cache else _conversion_temp_root(),
+        )
     else:
         os.makedirs(output_dir, exist_ok=True)
 
-    # 获取LibreOffice命令
-    libreoffice_cmd = get_libreoffice_command()
+    # 同名文件会在输出目录中互相覆盖，拆分到不同批次转换
+    batches: List[List[str]] = []
+    for doc_path in pending:
+        docx_filename = _docx_filename(doc_path)
+        for batch in batches:
+            if all(_docx_filename(p) != docx_filename for p in batch):
+                batch.append(doc_path)
+                break
+        else:
+            batches.append([doc_path])
 
+    try:
+        for batch in batches:
+            converted = await _run_libreoffice_conversion(
+                libreoffice_cmd, batch, output_dir
+            )
+            if use_cache:
+                # 转换结果移入缓存目录
+                for doc_path, docx_path in converted.items():
+                    os.replace(docx_path, cache_paths[doc_path])
+                    converted[doc_path] = cache_paths[doc_path]
+            results.update(converted)
+    finally:
+        if use_cache:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    if use_cache and cache_paths:
+        _evict_conversion_cache()
+    return results
+
+
+def _conversion_cache_dir() -> str:
+    """DOC转换缓存目录，默认位于当前用户目录下（不使用多用户共享的系统临时目录）"""
+    cache_dir = LIBREOFFICE_CONFIG["cache_dir"] or os.path.join(
+        os.path.expanduser("~"), ".cache", "tableparser", "doc_conversion"
+    )
+    return _ensure_directory(os.path.abspath(cache_dir))
+
+
+@functools.lru_cache(maxsize=1)
+def _conversion_temp_root() -> Optional[str]:
+    """
+    转换输出临时目录的父目录：优先使用配置的目录；Linux下 /dev/shm 可写时使用内存文件系统，
+    省去转换结果写盘再读回的磁盘往返；其余情况返回None，使用系统临时目录
+    """
+    if LIBREOFFICE_CONFIG["temp_dir"]:
+        return _ensure_directory(os.path.abspath(LIBREOFFICE_CONFIG["temp_dir"]))
+    if platform.system() == "Linux" and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _ensure_directory(path: str) -> str:
+    """创建目录（仅当前用户可访问；每个路径在进程内只检查一次）"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+def _conversion_cache_path(
+    doc_path: str, stat: Optional[os.stat_result] = None
+) -> str:
+    """根据DOC文件内容的SHA-256计算缓存的DOCX路径，stat可复用调用方已获取的结果"""
+    if stat is None:
+        stat = os.stat(doc_path)
+    digest = _content_hash(os.path.abspath(doc_path), stat.st_mtime_ns, stat.st_size)
+    return os.path.join(_conversion_cache_dir(), f"{digest}.docx")
+
+
+@functools.lru_cache(maxsize=1024)
+def _content_hash(abs_path: str, mtime_ns: int, size: int) -> str:
+    """
+    文件内容的SHA-256；以 (路径, 修改时间, 文件大小) 为键缓存最近的结果，
+    避免重复读取未变化的文件，同时限制常驻服务中的缓存条目数
+    """
+    hasher = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _is_cached_conversion(docx_path: str) -> bool:
+    """判断DOCX文件是否位于转换缓存目录中"""
+    return os.path.dirname(os.path.abspath(docx_path)) == _conversion_cache_dir()
+
+
+def _evict_conversion_cache() -> None:
+    """按修改时间淘汰最久未使用的缓存文件，保持缓存数量不超过上限"""
+    try:
+        _evict_cache_dir(
+            _conversion_cache_dir(), ".docx", LIBREOFFICE_CONFIG["cache_max_entries"]
+        )
+    except OSError as e:
+        logger.warning(f"清理DOC转换缓存失败: {str(e)}")
+
+
+def _evict_cache_dir(cache_dir: str, suffix: str, max_entries: int) -> None:
+    """
+    按修改时间删除缓存目录中最久未使用的 suffix 文件，使数量不超过 max_entries。
+    其他进程或线程同时淘汰时，已被删除的文件直接跳过，不中断本次清理
+    """
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if not entry.name.endswith(suffix):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    if len(entries) <= max_entries:
+        return
+    entries.sort()
+    for _, path in entries[: len(entries) - max_entries]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _docx_filename(doc_path: str) -> str:
+    """DOC文件转换后的DOCX文件名"""
+    return os.path.splitext(os.path.basename(doc_path))[0] + ".docx"
+
+
+async def _run_libreoffice_conversion(
+    libreoffice_cmd: str, doc_paths: List[str], output_dir: str
+) -> Dict[str, str]:
+    """执行一次LibreOffice转换调用，doc_paths中的文件名互不相同"""
     # 构建转换命令
     cmd = [
         libreoffice_cmd,
@@ -121,38 +552,272 @@ def convert_doc_to_docx(doc_path: str, output_dir: Optional[str] = None) -> str:
         "docx",
         "--outdir",
         output_dir,
-        doc_path,
+        *doc_paths,
     ]
+    timeout = CONVERSION_TIMEOUT * len(doc_paths)
 
     try:
-        # 执行转换命令
-        result = subprocess.run(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60  # 60秒超时
+        # 优先复用常驻监听进程，不可用或失败时冷启动LibreOffice
+        result = None
+        # 首次获取时会启动监听进程并等待端口就绪，放到线程池中执行
+        service = await asyncio.get_running_loop().run_in_executor(
+            None, LibreOfficeService.get_instance
         )
-
-        if result.returncode != 0:
-            error_msg = result.stderr.decode("utf-8", errors="ignore")
-            raise ConversionError(f"LibreOffice转换失败: {error_msg}")
+        if service is not None:
+            result = await service.convert(doc_paths, output_dir, timeout=timeout)
+            if result is not None and result.returncode != 0:
+                logger.warning(
+                    f"LibreOffice监听进程转换失败，改为冷启动转换: "
+                    f"{result.stderr.decode('utf-8', errors='ignore')}"
+                )
+                result = None
+        if result is None:
+            result = await _run_subprocess_async(cmd, timeout)
 
         # 检查转换结果
-        doc_filename = os.path.basename(doc_path)
-        docx_filename = os.path.splitext(doc_filename)[0] + ".docx"
-        docx_path = os.path.join(output_dir, docx_filename)
-
-        if not os.path.exists(docx_path):
-            raise ConversionError(f"转换后的DOCX文件不存在: {docx_path}")
+        results = {}
+        for doc_path in doc_paths:
+            docx_path = os.path.join(output_dir, _docx_filename(doc_path))
+            try:
+                docx_size = os.stat(docx_path).st_size
+            except FileNotFoundError:
+                continue
+            logger.info(f"成功将DOC文件转换为DOCX: {docx_path}（{docx_size} 字节）")
+            results[doc_path] = docx_path
 
-        logger.info(f"成功将DOC文件转换为DOCX: {docx_path}")
-        return docx_path
+        if result.returncode != 0 and not results:
+            error_msg = result.stderr.decode("utf-8", errors="ignore")
+            raise ConversionError(f"LibreOffice转换失败: {error_msg}")
+        return results
 
     except subprocess.TimeoutExpired:
-        raise ConversionTimeoutError("DOC转DOCX转换超时（60秒）")
+        raise ConversionTimeoutError(f"DOC转DOCX转换超时（{timeout}秒）")
     except Exception as e:
         if isinstance(e, (ConversionError, ConversionTimeoutError)):
             raise
         raise ConversionError(f"转换过程中发生未知错误: {str(e)}")
 
 
+class _DocConversionBatcher:
+    """合并短时间窗口内并发提交的DOC转换请求，交给一次LibreOffice调用批量完成"""
+
+    def __init__(self, window: float, max_batch_size: int):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def convert(self, doc_path: str) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((doc_path, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        doc_paths = [doc_path for doc_path, _ in batch]
+        if len(batch) > 1:
+            logger.info(f"合并转换 {len(batch)} 个DOC文件")
+        try:
+            results = await convert_docs_to_docx_async(doc_paths)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for doc_path, future in batch:
+            if future.done():
+                continue
+            if doc_path in results:
+                future.set_result(results[doc_path])
+            else:
+                future.set_exception(
+                    ConversionError(f"转换后的DOCX文件不存在: {doc_path}")
+                )
+
+
+# 每个事件循环各自维护一个转换合并器（Future与事件循环绑定）
+_conversion_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _DocConversionBatcher]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def convert_doc_to_docx_batched(
+    doc_path: str, return_bytes: bool = False
+) -> Union[str, bytes]:
+    """
+    异步转换DOC文件，同一时间窗口内的并发请求合并为一次LibreOffice调用。
+    return_bytes为True时返回DOCX内容并清理临时转换文件。
+    """
+    loop = asyncio.get_running_loop()
+    batcher = _conversion_batchers.get(loop)
+    if batcher is None:
+        batcher = _DocConversionBatcher(
+            LIBREOFFICE_CONFIG["batch_window"], LIBREOFFICE_CONFIG["max_batch_size"]
+        )
+        _conversion_batchers[loop] = batcher
+    docx_path = await batcher.convert(doc_path)
+    if return_bytes:
+        return await loop.run_in_executor(None, _read_converted_docx, docx_path)
+    return docx_path
+
+
+_WORD_NAMESPACES = {
+    "w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+}
+
+# 段落文本取值规则与 python-docx 的 Paragraph.text 一致（w:r 及 w:hyperlink 内 w:r 的
+# 文本类子元素，按文档顺序拼接），预编译为一次XPath查询，避免逐个run重复编译查询
+_RUN_TEXT_CHILDREN = (
+    "*[self::w:br or self::w:cr or self::w:noBreakHyphen"
+    " or self::w:ptab or self::w:t or self::w:tab]"
+)
+_PARAGRAPH_TEXT_XPATH = etree.XPath(
+    f"./w:r/{_RUN_TEXT_CHILDREN} | ./w:hyperlink/w:r/{_RUN_TEXT_CHILDREN}",
+    namespaces=_WORD_NAMESPACES,
+)
+
+# 表格单元格HTML模板，空单元格统一以 "-" 占位（调用方传入 text or "-"）；
+# 传入的文本须已做HTML转义
+_HTML_TD = "<td>{}</td>".format
+_HTML_TH = "<th>{}</th>".format
+_HTML_TH_COLSPAN = '<th colspan="{}">{}</th>'.format
+
+
+def _escape_html_cell(text: str) -> str:
+    """转义HTML表格单元格文本中的 &、<、>"""
+    return escape(text, quote=False)
+
+
+def _escape_markdown_cell(text: str) -> str:
+    """转义Markdown表格单元格文本中的竖线，避免破坏列结构"""
+    return text.replace("|", "\\|")
+
+
+# 表头关键词（单元格包含任一关键词即计数），预编译为一个正则
+_HEADER_KEYWORD_RE = re.compile(
+    "|".join(
+        map(re.escape, ["年度", "年份", "学校", "名称", "情况", "人数", "合计", "备注"])
+    )
+)
+
+# 数值判断：一次 translate 去掉常见非数值字符，常规十进制数字走正则快速判断
+_NUMERIC_STRIP_TABLE = str.maketrans("", "", ",%+-")
+_PLAIN_NUMBER_RE = re.compile(r"\s*(?:\d+(?:\.\d*)?|\.\d+)\s*")
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_VAL = _W_NS + "val"
+_W_GRIDSPAN = _W_NS + "gridSpan"
+_W_VMERGE = _W_NS + "vMerge"
+_W_P = _W_NS + "p"
+_W_TBL = _W_NS + "tbl"
+_W_TR = _W_NS + "tr"
+
+
+def _find_cell_merge_marks(
+    tc,
+) -> Tuple[Optional[etree._Element], Optional[etree._Element]]:
+    """
+    一次遍历取出单元格中首个 w:gridSpan 与 w:vMerge（未找到为None），
+    结果与 tc.xpath(".//w:gridSpan")[0]、tc.xpath(".//w:vMerge")[0] 相同
+    """
+    gridspan = vmerge = None
+    for element in tc.iter(_W_GRIDSPAN, _W_VMERGE):
+        if element.tag == _W_GRIDSPAN:
+            if gridspan is None:
+                gridspan = element
+        elif vmerge is None:
+            vmerge = element
+        if gridspan is not None and vmerge is not None:
+            break
+    return gridspan, vmerge
+
+
+def _vertical_merge_rowspan(tc) -> int:
+    """
+    纵向合并起始单元格的实际合并行数：向下逐行查看同一网格列的单元格，
+    统计连续的 vMerge 为 continue 的行（一次顺序扫描，不逐行回溯行号）
+    """
+    grid_offset = tc.grid_offset
+    rowspan = 1
+    for tr_below in tc.getparent().itersiblings(_W_TR):
+        try:
+            tc_below = tr_below.tc_at_grid_offset(grid_offset)
+        except ValueError:
+            break
+        if tc_below.vMerge != "continue":
+            break
+        rowspan += 1
+    return rowspan
+
+
+# 表格内任意位置的合并标记；与逐单元格的 .//w:gridSpan、.//w:vMerge 检测范围一致
+_TABLE_MERGE_XPATH = etree.XPath(
+    "boolean(.//w:gridSpan | .//w:vMerge)", namespaces=_WORD_NAMESPACES
+)
+
+
+def _paragraph_text(p_element) -> str:
+    """直接从 w:p 元素提取段落文本，结果与 Paragraph(p_element, ...).text 相同"""
+    return "".join(str(e) for e in _PARAGRAPH_TEXT_XPATH(p_element))
+
+
+def _cell_text(tc) -> str:
+    """直接从 w:tc 元素提取单元格文本，结果与 _Cell(tc, ...).text 相同"""
+    return "\n".join(_paragraph_text(p) for p in tc.iterchildren(_W_P))
+
+
+# 不超过该长度的单元格文本会被驻留（表头、年份等短文本在各列、各表格间大量重复）
+_INTERN_MAX_LEN = 64
+
+
+def _intern_cell_text(text: str) -> str:
+    """驻留较短的单元格文本，重复文本共用同一对象；过长文本不驻留以免占用驻留表"""
+    return sys.intern(text) if len(text) <= _INTERN_MAX_LEN else text
+
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """获取共享的DOCX解析进程池，parse_workers为0时返回None（在当前线程解析）"""
+    global _parse_pool
+    workers = DOC_PARSER_CONFIG["parse_workers"]
+    if workers <= 0:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # 主进程已运行事件循环与线程池线程，fork 子进程可能继承被占用的锁而死锁，
+            # 改用 spawn 启动解析进程
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+
+def _build_docx_chunks_in_worker(
+    parse_config: Dict, source: Union[str, bytes], doc_id: str
+) -> List[Dict]:
+    """
+    进程池入口：按构块配置在子进程中构建DOCX分块。
+    启用图片处理时，图片由子进程的提取器直接写入同一图片存储目录，返回的图片块与主进程解析时一致
+    """
+    parser = DocFileParser._from_parse_config(parse_config)
+    return parser._build_docx_chunks(source, doc_id)
+
+
 class DocFileParser:
     """DOC/DOCX文件解析器，docx用python-docx，doc用textract/antiword，输出分块结构"""
 
@@ -166,20 +831,21 @@ class DocFileParser:
             if fragment_config
             else TableProcessingConfig()
         )
+        # 表格分析结果缓存（表头行数、合并单元格），以表格XML元素为弱引用键，
+        # 文档释放后自动失效
+        self._table_analysis_cache = weakref.WeakKeyDictionary()
 
         # 新增图片处理组件
         try:
-            from utils.config_manager import ConfigManager
-
             config_manager = ConfigManager()
             image_config = config_manager.get_image_processing_config()
+            # 图片视觉分析的最大并发数（与视觉模型接口并发限制一致）
+            self.image_max_concurrent = image_config.get("max_concurrent", 5)
 
-            if image_config.get("enabled", False):
-                from .image_processing.image_extractor import ImageExtractor
-                from .image_processing.context_collector import ContextCollector
-                from .image_processing.image_analyzer import ImageAnalyzer
-                from utils.zhipu_client import VisionModelClient
-
+            if image_config.get("enabled", False) and ImageExtractor is None:
+                logger.warning("图片处理组件不可用，将禁用图片处理功能")
+                self.image_processing_enabled = False
+            elif image_config.get("enabled", False):
                 self.image_extractor = ImageExtractor(
                     image_config.get("storage_path", "storage/images")
                 )
@@ -206,17 +872,65 @@ class DocFileParser:
             logger.warning(f"图片处理组件初始化失败，将禁用图片处理功能: {str(e)}")
             self.image_processing_enabled = False
 
+    def _get_parse_config(self) -> Dict:
+        """构块所需的可序列化配置（表格配置与图片策略），用于在解析进程中重建解析器"""
+        parse_config = {
+            "table_config": self.table_config,
+            "image_processing_enabled": self.image_processing_enabled,
+        }
+        if self.image_processing_enabled:
+            parse_config.update(
+                image_storage_path=self.image_extractor.storage_path,
+                image_position_strategy=self.image_position_strategy,
+                table_image_attach_mode=self.table_image_attach_mode,
+            )
+        return parse_config
+
+    @classmethod
+    def _from_parse_config(cls, parse_config: Dict) -> "DocFileParser":
+        """按构块配置创建只用于构块的解析器，不初始化分片与图片分析组件"""
+        parser = cls.__new__(cls)
+        parser.fragment_manager = None
+        parser.table_config = parse_config["table_config"]
+        parser._table_analysis_cache = weakref.WeakKeyDictionary()
+        parser.image_processing_enabled = parse_config["image_processing_enabled"]
+        if parser.image_processing_enabled:
+            parser.image_extractor = ImageExtractor(parse_config["image_storage_path"])
+            parser.image_position_strategy = parse_config["image_position_strategy"]
+            parser.table_image_attach_mode = parse_config["table_image_attach_mode"]
+        return parser
+
+    async def process_many(self, file_paths: List[str]) -> List[List[Dict]]:
+        """
+        并发解析多个Word文档，返回结果与输入顺序一致。
+        每个文档解析完成后立即开始LLM增强，与其余文档的解析重叠进行；
+        各文档的增强共用同一个信号量，总并发不超过 LLM_CONFIG["max_async"]
+        """
+        semaphore = asyncio.Semaphore(max(1, LLM_CONFIG["max_async"]))
+
+        async def parse_and_enhance(file_path: str) -> List[Dict]:
+            chunks = await self._parse_chunks(file_path)
+            if not chunks:
+                return chunks
+            return await self._enhance_chunks(chunks, semaphore)
+
+        return list(
+            await asyncio.gather(*(parse_and_enhance(path) for path in file_paths))
+        )
+
     async def process(self, file_path: str) -> List[Dict]:
+        chunks = await self._parse_chunks(file_path)
+        if not chunks:
+            return chunks
+        return await self._enhance_chunks(chunks)
+
+    async def _parse_chunks(self, file_path: str) -> List[Dict]:
+        """解析文档并完成分片、编号，不含LLM增强；解析失败时返回空列表"""
         logger.info(f"开始解析Word文档: {file_path}")
         if not os.path.exists(file_path):
             logger.error(f"文件不存在: {file_path}")
             return []
 
-        # 清空图片提取器缓存，确保每个文档的图片处理都是独立的
-        if hasattr(self, "image_extractor") and self.image_extractor:
-            self.image_extractor.clear_cache()
-            logger.debug(f"已清空图片提取器缓存，准备处理新文档: {file_path}")
-
         _, ext = os.path.splitext(file_path)
         ext = ext.lower().lstrip(".")
         doc_id = os.path.basename(file_path)
@@ -250,24 +964,14 @@ class DocFileParser:
         # 为每个分块添加chunk_id
         for idx, chunk in enumerate(chunks):
             chunk["chunk_id"] = f"{doc_id}_{idx+1}"
+        return chunks
 
-        # 调用LLM增强所有分块
+    async def _enhance_chunks(
+        self, chunks: List[Dict], semaphore: Optional[asyncio.Semaphore] = None
+    ) -> List[Dict]:
+        """调用LLM增强所有分块，增强失败时返回原始分块"""
         try:
-            import asyncio
-            import nest_asyncio
-
-            # 应用nest_asyncio以支持嵌套事件循环
-            nest_asyncio.apply()
-
-            # 检查是否已有运行的事件循环
-            try:
-                loop = asyncio.get_running_loop()
-                # 如果已有事件循环，创建任务
-                task = loop.create_task(enhance_all_chunks(chunks))
-                enhanced_chunks = loop.run_until_complete(task)
-            except RuntimeError:
-                # 如果没有运行的事件循环，使用asyncio.run
-                enhanced_chunks = asyncio.run(enhance_all_chunks(chunks))
+            enhanced_chunks = await enhance_all_chunks(chunks, semaphore)
 
             # 统计增强的块类型
             enhanced_table_chunks = [
@@ -292,274 +996,316 @@ class DocFileParser:
     async def _process_docx(self, file_path: str, doc_id: str) -> List[Dict]:
         """解析DOCX文件，提取段落、表格和图片内容"""
         try:
-            from docx import Document
+            return await self._process_docx_source(file_path, doc_id)
+        except Exception as e:
+            logger.error(f"解析DOCX文件出错: {file_path}, 错误: {str(e)}")
+            raise
+
+    async def _process_docx_bytes(self, data: bytes, doc_id: str) -> List[Dict]:
+        """解析内存中的DOCX内容（如DOC转换结果），无需落盘"""
+        try:
+            return await self._process_docx_source(data, doc_id)
+        except Exception as e:
+            logger.error(f"解析DOCX内容出错: {doc_id}, 错误: {str(e)}")
+            raise
+
+    async def _process_docx_source(
+        self, source: Union[str, bytes], doc_id: str
+    ) -> List[Dict]:
+        """解析DOCX文件路径或内容，提取段落、表格和图片内容"""
+        # CPU密集的XML解析放到进程池执行，图片分析仍在事件循环中并发进行
+        all_chunks = await self._build_docx_chunks_async(source, doc_id)
+
+        # 内联模式下，图片块已经插入 all_chunks；选择分析时机
+        if self.image_processing_enabled:
+            # 收集本轮生成的图片块
+            image_chunks = [c for c in all_chunks if c.get("type") == "image"]
+            if image_chunks:
+                try:
+                    await self._process_images_async(image_chunks, all_chunks)
+                except Exception as e:
+                    logger.warning(f"图片分析失败: {str(e)}")
 
-            document = Document(file_path)
+        return all_chunks
 
-            # 混合遍历段落和表格，记录表格前后段落索引
-            block_items = list(self._iter_block_items(document))
-            # 先收集所有段落内容
-            all_paragraphs = [
-                block.text
-                for block in block_items
-                if isinstance(block, Paragraph) and block.text.strip()
-            ]
-            paragraphs = []
-            all_chunks = []
-            para_idx = 0
-            # 全局图片索引，保证文档范围内唯一且递增
-            global_image_index = 0
-            # 构块阶段全局去重：记录已处理过的图片关系ID（rel_id）
-            seen_rel_ids = set()
-            for idx, block in enumerate(block_items):
-                if isinstance(block, Paragraph):
-                    has_text = bool(block.text.strip())
-                    if has_text:
-                        paragraphs.append(block.text)
-                        context = self._get_context_for_paragraph(
-                            all_paragraphs, para_idx
+    async def _build_docx_chunks_async(
+        self, source: Union[str, bytes], doc_id: str
+    ) -> List[Dict]:
+        """在解析进程池中构建DOCX分块，未启用进程池时直接在当前线程执行"""
+        pool = _get_parse_pool()
+        if pool is None:
+            return self._build_docx_chunks(source, doc_id)
+        return await asyncio.get_running_loop().run_in_executor(
+            pool,
+            _build_docx_chunks_in_worker,
+            self._get_parse_config(),
+            source,
+            doc_id,
+        )
+
+    def _build_docx_chunks(self, source: Union[str, bytes], doc_id: str) -> List[Dict]:
+        """同步解析DOCX文件路径或内容，生成段落、表格和图片块（不含图片分析）"""
+        document = Document(BytesIO(source) if isinstance(source, bytes) else source)
+        return self._build_docx_document_chunks(document, doc_id)
+
+    def _build_docx_document_chunks(self, document, doc_id: str) -> List[Dict]:
+        """基于已加载的python-docx文档生成段落、表格和图片块（不含图片分析）"""
+        # 清空图片提取器缓存，确保每个文档的图片处理都是独立的
+        # （在构块开始时同步清空，避免并发解析的文档之间互相影响）
+        if getattr(self, "image_extractor", None):
+            self.image_extractor.clear_cache()
+            logger.debug(f"已清空图片提取器缓存，准备处理新文档: {doc_id}")
+
+        # 第一遍流式遍历只提取段落文本（Paragraph.text 每次访问都会遍历XML），
+        # 同时收集所有非空段落内容；表格位置记为None，不保留块包装对象
+        block_texts: List[Optional[str]] = []
+        all_paragraphs = []
+        # 直接遍历底层XML元素，不构造python-docx包装对象
+        for kind, element in self._iter_block_elements(document):
+            if kind == "p":
+                text = _paragraph_text(element)
+                block_texts.append(text)
+                if text.strip():
+                    all_paragraphs.append(text)
+            else:
+                block_texts.append(None)
+        paragraphs = []
+        all_chunks = []
+        para_idx = 0
+        # 全局图片索引，保证文档范围内唯一且递增
+        global_image_index = 0
+        # 构块阶段全局去重：记录已处理过的图片关系ID（rel_id）
+        seen_rel_ids = set()
+        # table_id 由 id(block) 生成，持有已处理的表格对象以免其内存地址被复用
+        processed_tables: List[Table] = []
+        # 第二遍流式遍历段落和表格生成分块，记录表格前后段落索引
+        for idx, (kind, element) in enumerate(self._iter_block_elements(document)):
+            if kind == "p":
+                text = block_texts[idx]
+                has_text = bool(text.strip())
+                if has_text:
+                    paragraphs.append(text)
+                    context = self._get_context_for_paragraph(
+                        all_paragraphs, para_idx
+                    )
+                    chunk = {
+                        "type": "text",
+                        "content": text,  # 纯文本输出
+                        "metadata": {
+                            "doc_id": doc_id,
+                            "paragraph_index": para_idx + 1,
+                        },
+                        "context": context,
+                    }
+                    all_chunks.append(chunk)
+
+                # 段落后内联图片（无论该段是否有文本）
+                if (
+                    self.image_processing_enabled
+                    and self.image_position_strategy == "inline"
+                ):
+                    try:
+                        # 仅在需要定位图片时构造段落包装对象
+                        discovered = self.image_extractor.discover_images_in_paragraph(
+                            Paragraph(element, document)
                         )
-                        chunk = {
-                            "type": "text",
-                            "content": block.text,  # 纯文本输出
-                            "metadata": {
-                                "doc_id": doc_id,
-                                "paragraph_index": para_idx + 1,
-                            },
-                            "context": context,
-                        }
-                        all_chunks.append(chunk)
-
-                    # 段落后内联图片（无论该段是否有文本）
-                    if (
-                        self.image_processing_enabled
-                        and self.image_position_strategy == "inline"
-                    ):
-                        try:
-                            discovered = (
-                                self.image_extractor.discover_images_in_paragraph(block)
+                        for order_in_para, item in enumerate(discovered):
+                            rel_id = item.get("rel_id")
+                            if not rel_id:
+                                continue
+                            # 去重：同一图片（rel_id）仅生成一个图片块
+                            if rel_id in seen_rel_ids:
+                                continue
+                            image_meta = self.image_extractor.get_or_save_by_rel(
+                                document,
+                                rel_id,
+                                doc_id,
+                                image_index=global_image_index,
+                            )
+                            if not image_meta:
+                                continue
+                            seen_rel_ids.add(rel_id)
+                            paragraph_index_for_anchor = (
+                                (para_idx + 1)
+                                if has_text
+                                else (para_idx if para_idx > 0 else 1)
+                            )
+                            anchor_meta = {
+                                "container_type": "paragraph",
+                                "paragraph_index": paragraph_index_for_anchor,
+                                "anchor_index": len(all_chunks),
+                            }
+                            image_chunk = self.image_extractor.build_image_chunk(
+                                doc_id, image_meta, anchor_meta
                             )
-                            for order_in_para, item in enumerate(discovered):
-                                rel_id = item.get("rel_id")
-                                if not rel_id:
-                                    continue
-                                # 去重：同一图片（rel_id）仅生成一个图片块
-                                if rel_id in seen_rel_ids:
-                                    continue
-                                image_meta = self.image_extractor.get_or_save_by_rel(
+                            all_chunks.append(image_chunk)
+                            global_image_index += 1
+
+                        # 调试摘要仅在DEBUG级别下计算
+                        if discovered and logger.isEnabledFor(logging.DEBUG):
+                            if has_text:
+                                prev_para, next_para = self._get_neighbor_paragraphs(
+                                    all_paragraphs, para_idx
+                                )
+                                logger.debug(
+                                    f"段落{para_idx + 1}后插入图片{len(discovered)}张，前后摘要：{prev_para[:20]} | {next_para[:20]}"
+                                )
+                            else:
+                                logger.debug(
+                                    f"空段落后插入图片{len(discovered)}张（锚定到段落{para_idx if para_idx > 0 else 1}）"
+                                )
+                    except Exception as e:
+                        logger.warning(f"段落内联图片处理失败，已跳过：{e}")
+
+                if has_text:
+                    para_idx += 1
+            else:
+                block = Table(element, document)
+                processed_tables.append(block)
+                # 找到表格前后最近的段落索引
+                preceding = para_idx if para_idx > 0 else None
+                # 表格之前已有para_idx个非空段落，若全文非空段落更多，
+                # 则下一个段落索引即为para_idx + 1，无需向后扫描
+                following = (
+                    para_idx + 1 if para_idx < len(all_paragraphs) else None
+                )
+                table_chunks = self._split_table_with_merge(
+                    block, doc_id, preceding, following, paragraphs=all_paragraphs
+                )
+                all_chunks.extend(table_chunks)
+
+                # 表格内图片处理
+                if (
+                    self.image_processing_enabled
+                    and self.image_position_strategy == "inline"
+                ):
+                    try:
+                        # 构造 table_id，与 _split_table_with_merge 保持一致
+                        table_id = f"table_{id(block)}"
+                        # 表头行数仅用于图片锚点信息，发现首张图片时才检测
+                        header_rows = None
+                        # 收集每个单元格的图片
+                        table_images: List[Dict] = []
+                        for item in self.image_extractor.discover_images_in_table(block):
+                            r_idx, c_idx = item["row_index"], item["col_index"]
+                            rel_id = item.get("rel_id")
+                            if not rel_id:
+                                continue
+                            # 去重：同一图片（rel_id）仅生成一个图片块
+                            if rel_id in seen_rel_ids:
+                                continue
+                            image_meta = (
+                                self.image_extractor.get_or_save_by_rel(
                                     document,
                                     rel_id,
                                     doc_id,
                                     image_index=global_image_index,
                                 )
-                                if not image_meta:
-                                    continue
-                                seen_rel_ids.add(rel_id)
-                                paragraph_index_for_anchor = (
-                                    (para_idx + 1)
-                                    if has_text
-                                    else (para_idx if para_idx > 0 else 1)
+                            )
+                            if not image_meta:
+                                continue
+                            seen_rel_ids.add(rel_id)
+                            if header_rows is None:
+                                header_rows = self._detect_header_rows_smart(
+                                    block
                                 )
-                                anchor_meta = {
-                                    "container_type": "paragraph",
-                                    "paragraph_index": paragraph_index_for_anchor,
-                                    "anchor_index": len(all_chunks),
-                                }
-                                image_chunk = self.image_extractor.build_image_chunk(
+                            anchor_meta = {
+                                "container_type": "table_cell",
+                                "table_id": table_id,
+                                "row": r_idx + 1,
+                                "col": c_idx + 1,
+                                "parent_table_info": f"header_rows={header_rows}",
+                                "anchor_index": len(all_chunks),
+                            }
+                            image_chunk = (
+                                self.image_extractor.build_image_chunk(
                                     doc_id, image_meta, anchor_meta
                                 )
-                                all_chunks.append(image_chunk)
-                                global_image_index += 1
-
-                            if discovered:
-                                if has_text:
-                                    try:
-                                        ctx = self._get_context_for_paragraph(
-                                            all_paragraphs, para_idx
+                            )
+                            table_images.append(
+                                {
+                                    "row": r_idx + 1,
+                                    "col": c_idx + 1,
+                                    "chunk": image_chunk,
+                                }
+                            )
+                            global_image_index += 1
+
+                        # 按策略附着
+                        if table_images:
+                            if self.table_image_attach_mode == "separate_block":
+                                # 插在表格相关块之后（当前已把表格块加入 all_chunks，直接 append）
+                                for ti in table_images:
+                                    all_chunks.append(ti["chunk"])
+                                # 计算邻接段落摘要用于调试（仅在DEBUG级别下计算）
+                                if logger.isEnabledFor(logging.DEBUG):
+                                    prev_text = (
+                                        self.get_paragraph_content_by_index(
+                                            all_paragraphs, preceding
                                         )
-                                        prev20 = ctx.split("。下一段：")[0].replace(
-                                            "上一段：", ""
-                                        )[:20]
-                                        next20 = ctx.split("。下一段：")[-1][:20]
-                                    except Exception:
-                                        prev20, next20 = "", ""
-                                    logger.debug(
-                                        f"段落{para_idx + 1}后插入图片{len(discovered)}张，前后摘要：{prev20} | {next20}"
-                                    )
-                                else:
-                                    logger.debug(
-                                        f"空段落后插入图片{len(discovered)}张（锚定到段落{paragraph_index_for_anchor}）"
+                                        or ""
                                     )
-                        except Exception as e:
-                            logger.warning(f"段落内联图片处理失败，已跳过：{e}")
-
-                    if has_text:
-                        para_idx += 1
-                elif isinstance(block, Table):
-                    # 找到表格前后最近的段落索引
-                    preceding = para_idx if para_idx > 0 else None
-                    # 查找下一个段落
-                    following = None
-                    for j in range(idx + 1, len(block_items)):
-                        if (
-                            isinstance(block_items[j], Paragraph)
-                            and block_items[j].text.strip()
-                        ):
-                            following = para_idx + 1  # 预期下一个段落索引
-                            break
-                    table_chunks = self._split_table_with_merge(
-                        block, doc_id, preceding, following, paragraphs=all_paragraphs
-                    )
-                    all_chunks.extend(table_chunks)
-
-                    # 表格内图片处理
-                    if (
-                        self.image_processing_enabled
-                        and self.image_position_strategy == "inline"
-                    ):
-                        try:
-                            # 构造 table_id，与 _split_table_with_merge 保持一致
-                            table_id = f"table_{id(block)}"
-                            header_rows = self._detect_header_rows_smart(block)
-                            # 收集每个单元格的图片
-                            table_images: List[Dict] = []
-                            for r_idx, row in enumerate(block.rows):
-                                for c_idx, cell in enumerate(row.cells):
-                                    discovered = self.image_extractor.discover_images_in_table_cell(
-                                        cell
-                                    )
-                                    if not discovered:
-                                        continue
-                                    for item in discovered:
-                                        rel_id = item.get("rel_id")
-                                        if not rel_id:
-                                            continue
-                                        # 去重：同一图片（rel_id）仅生成一个图片块
-                                        if rel_id in seen_rel_ids:
-                                            continue
-                                        image_meta = (
-                                            self.image_extractor.get_or_save_by_rel(
-                                                document,
-                                                rel_id,
-                                                doc_id,
-                                                image_index=global_image_index,
-                                            )
-                                        )
-                                        if not image_meta:
-                                            continue
-                                        seen_rel_ids.add(rel_id)
-                                        anchor_meta = {
-                                            "container_type": "table_cell",
-                                            "table_id": table_id,
-                                            "row": r_idx + 1,
-                                            "col": c_idx + 1,
-                                            "parent_table_info": f"header_rows={header_rows}",
-                                            "anchor_index": len(all_chunks),
-                                        }
-                                        image_chunk = (
-                                            self.image_extractor.build_image_chunk(
-                                                doc_id, image_meta, anchor_meta
-                                            )
+                                    next_text = (
+                                        self.get_paragraph_content_by_index(
+                                            all_paragraphs, following
                                         )
-                                        table_images.append(
-                                            {
-                                                "row": r_idx + 1,
-                                                "col": c_idx + 1,
-                                                "chunk": image_chunk,
-                                            }
-                                        )
-                                        global_image_index += 1
-
-                            # 按策略附着
-                            if table_images:
-                                if self.table_image_attach_mode == "separate_block":
-                                    # 插在表格相关块之后（当前已把表格块加入 all_chunks，直接 append）
-                                    for ti in table_images:
-                                        all_chunks.append(ti["chunk"])
-                                    # 计算邻接段落摘要用于调试
-                                    try:
-                                        prev_text = (
-                                            self.get_paragraph_content_by_index(
-                                                all_paragraphs, preceding
-                                            )
-                                            if all_paragraphs
-                                            else ""
-                                        ) or ""
-                                        next_text = (
-                                            self.get_paragraph_content_by_index(
-                                                all_paragraphs, following
-                                            )
-                                            if all_paragraphs
-                                            else ""
-                                        ) or ""
-                                    except Exception:
-                                        prev_text, next_text = "", ""
-                                    logger.debug(
-                                        f"表格{table_id}后追加图片{len(table_images)}张，邻接段落摘要：{prev_text[:20]} | {next_text[:20]}"
-                                    )
-                                elif self.table_image_attach_mode == "merge_into_row":
-                                    # 合并进对应行块的 metadata.embedded_images
-                                    for ti in table_images:
-                                        row_no = ti["row"]
-                                        # 逆向查找刚加入的 table_row 对应的块（简易策略：查找最近的、table_id+row匹配）
-                                        for chk in reversed(all_chunks):
-                                            md = chk.get("metadata", {})
-                                            if (
-                                                chk.get("type") == "table_row"
-                                                and md.get("table_id") == table_id
-                                                and md.get("row") == row_no
-                                            ):
-                                                md.setdefault(
-                                                    "embedded_images", []
-                                                ).append(ti["chunk"])
-                                                break
-                                    logger.debug(
-                                        f"表格{table_id}按行合并图片{len(table_images)}张"
+                                        or ""
                                     )
-                                elif self.table_image_attach_mode == "merge_into_table":
-                                    # 合并进 table_full 的 metadata.embedded_images
-                                    for chk in reversed(all_chunks):
-                                        md = chk.get("metadata", {})
-                                        if (
-                                            chk.get("type") == "table_full"
-                                            and md.get("table_id") == table_id
-                                        ):
-                                            md.setdefault("embedded_images", []).extend(
-                                                [ti["chunk"] for ti in table_images]
-                                            )
-                                            break
                                     logger.debug(
-                                        f"表格{table_id}整体合并图片{len(table_images)}张"
+                                        f"表格{table_id}后追加图片{len(table_images)}张，邻接段落摘要：{prev_text[:20]} | {next_text[:20]}"
                                     )
-                        except Exception as e:
-                            logger.warning(f"表格内联图片处理失败，已跳过：{e}")
-
-            # 内联模式下，图片块已经插入 all_chunks；选择分析时机
-            if self.image_processing_enabled:
-                # 收集本轮生成的图片块
-                image_chunks = [c for c in all_chunks if c.get("type") == "image"]
-                if image_chunks:
-                    try:
-                        await self._process_images_async(image_chunks, all_chunks)
+                            elif self.table_image_attach_mode == "merge_into_row":
+                                # 合并进对应行块的 metadata.embedded_images
+                                # 按行号索引本表格刚生成的 table_row 块（同一行取最后一个）
+                                table_row_by_row = {
+                                    chk["metadata"].get("row"): chk
+                                    for chk in table_chunks
+                                    if chk.get("type") == "table_row"
+                                    and chk.get("metadata", {}).get("table_id")
+                                    == table_id
+                                }
+                                for ti in table_images:
+                                    row_chunk = table_row_by_row.get(ti["row"])
+                                    if row_chunk is not None:
+                                        row_chunk["metadata"].setdefault(
+                                            "embedded_images", []
+                                        ).append(ti["chunk"])
+                                logger.debug(
+                                    f"表格{table_id}按行合并图片{len(table_images)}张"
+                                )
+                            elif self.table_image_attach_mode == "merge_into_table":
+                                # 合并进 table_full 的 metadata.embedded_images
+                                # 只需在本表格刚生成的块中查找
+                                table_full_chunk = next(
+                                    (
+                                        chk
+                                        for chk in reversed(table_chunks)
+                                        if chk.get("type") == "table_full"
+                                        and chk.get("metadata", {}).get("table_id")
+                                        == table_id
+                                    ),
+                                    None,
+                                )
+                                if table_full_chunk is not None:
+                                    table_full_chunk["metadata"].setdefault(
+                                        "embedded_images", []
+                                    ).extend([ti["chunk"] for ti in table_images])
+                                logger.debug(
+                                    f"表格{table_id}整体合并图片{len(table_images)}张"
+                                )
                     except Exception as e:
-                        logger.warning(f"图片分析失败: {str(e)}")
+                        logger.warning(f"表格内联图片处理失败，已跳过：{e}")
 
-            return all_chunks
-        except ImportError:
-            logger.error("未安装python-docx库，无法解析DOCX文件")
-            raise
-        except Exception as e:
-            logger.error(f"解析DOCX文件出错: {file_path}, 错误: {str(e)}")
-            raise
+        return all_chunks
 
     async def _process_doc(self, file_path: str, doc_id: str) -> List[Dict]:
         """使用LibreOffice转换DOC文件为DOCX，然后解析"""
-        docx_path = None
         try:
-            # 使用LibreOffice将DOC文件转换为DOCX
-            docx_path = convert_doc_to_docx(file_path)
+            # 使用LibreOffice将DOC文件转换为DOCX（并发请求合并为批量转换），
+            # 直接取回DOCX内容，临时转换文件在读取后即被清理
+            docx_data = await convert_doc_to_docx_batched(file_path, return_bytes=True)
             # 使用现有的DOCX解析逻辑
-            chunks = await self._process_docx(docx_path, doc_id)
+            chunks = await self._process_docx_bytes(docx_data, doc_id)
             return chunks
         except (LibreOfficeNotFoundError, ConversionError, ConversionTimeoutError) as e:
             logger.error(f"DOC文件转换失败: {file_path}, 错误: {str(e)}")
@@ -567,17 +1313,6 @@ class DocFileParser:
         except Exception as e:
             logger.error(f"解析DOC文件出错: {file_path}, 错误: {str(e)}")
             raise
-        finally:
-            # 清理临时转换文件
-            if docx_path and os.path.exists(docx_path):
-                try:
-                    os.remove(docx_path)
-                    # 尝试删除临时目录（如果为空）
-                    temp_dir = os.path.dirname(docx_path)
-                    if os.path.exists(temp_dir) and not os.listdir(temp_dir):
-                        os.rmdir(temp_dir)
-                except Exception as e:
-                    logger.warning(f"清理临时文件失败: {str(e)}")
 
     def _split_paragraphs(self, paragraphs: List[str], doc_id: str) -> List[Dict]:
         chunks = []
@@ -703,36 +1438,85 @@ class DocFileParser:
         """
         增强的HTML表格转换，正确处理合并单元格
         """
-        if not table.rows:
+        # 行、单元格与单元格文本一次性取出，各遍历共用
+        grid = self._get_table_grid(table)
+        texts = grid["texts"]
+        if not texts:
             return "<table></table>", [], []
 
-        # 构建表头映射（使用带回退机制的方法）
-        header_mapping = self._build_header_mapping_with_fallback(table)
+        # 表头行数、表头单元格与合并单元格信息只计算一次，供各辅助方法共用
+        header_rows = self._detect_header_rows_smart(table)
+        header_texts = texts[:header_rows]
+        merged_cells = (
+            self._get_merged_cells_info_ultra_enhanced(table)
+            if self._table_has_any_merge(table)
+            else []
+        )
 
-        # 获取合并单元格信息
-        merged_cells = self._get_merged_cells_info_ultra_enhanced(table)
+        # 构建表头映射（使用带回退机制的方法）
+        header_mapping = self._build_header_mapping_with_fallback(
+            table, header_texts, merged_cells
+        )
 
         # 生成最终表头
-        headers = []
-        for col in range(len(table.rows[0].cells)):
-            header = header_mapping.get(col, "")
-            headers.append(header)
-
-        html = ["<table border='1'>"]
+        num_cols = len(texts[0])
+        headers = [header_mapping.get(col, "") for col in range(num_cols)]
 
         # 构建合并单元格映射，用于HTML生成
-        merge_map = self._build_merge_map_for_html_enhanced(
-            merged_cells, len(table.rows[0].cells)
-        )
+        merge_map = self._build_merge_map_for_html_enhanced(merged_cells, num_cols)
 
-        # 生成表头行
-        self._generate_html_header_rows_enhanced(table, html, merge_map, header_mapping)
+        # 一次遍历逐行生成表头行与表体行（使用已做HTML转义的单元格文本）
+        html = "\n".join(
+            self._iter_table_html_lines(
+                self._get_table_output_texts(table), merge_map, header_rows
+            )
+        )
+        return html, headers, merged_cells
 
-        # 生成表体行
-        self._generate_html_body_rows_enhanced(table, html, merge_map)
+    def _get_table_grid(self, table: Table) -> Dict:
+        """
+        一次性取出表格的行、各行单元格及去除首尾空白的单元格文本，按表格缓存。
+        python-docx 的 table.rows、row.cells、cell.text 每次访问都会重新遍历XML
+        """
+        analysis = self._get_table_analysis(table)
+        grid = analysis.get("grid")
+        if grid is None:
+            rows = list(table.rows)
+            cells = [row.cells for row in rows]
+            # 横向合并的各列、纵向合并的后续行都指向同一个 w:tc，文本只提取一次
+            text_by_tc = {}
+            texts = []
+            for row_cells in cells:
+                row_texts = []
+                for cell in row_cells:
+                    tc = cell._tc
+                    text = text_by_tc.get(tc)
+                    if text is None:
+                        text = _intern_cell_text(_cell_text(tc).strip())
+                        text_by_tc[tc] = text
+                    row_texts.append(text)
+                texts.append(row_texts)
+            grid = {"rows": rows, "cells": cells, "texts": texts}
+            analysis["grid"] = grid
+        return grid
+
+    def _get_table_output_texts(self, table: Table) -> List[List[str]]:
+        """按当前输出格式转义后的单元格文本（HTML转义或Markdown竖线转义），每个表格只转义一次"""
+        grid = self._get_table_grid(table)
+        output_texts = grid.get("output_texts")
+        if output_texts is None:
+            escape_cell = (
+                _escape_markdown_cell
+                if self.table_config.table_format == "markdown"
+                else _escape_html_cell
+            )
+            output_texts = [[escape_cell(text) for text in row] for row in grid["texts"]]
+            grid["output_texts"] = output_texts
+        return output_texts
 
-        html.append("</table>")
-        return "\n".join(html), headers, merged_cells
+    def _table_has_any_merge(self, table: Table) -> bool:
+        """一次XPath判断表格是否含有合并单元格，无合并时可跳过逐单元格的合并检测"""
+        return _TABLE_MERGE_XPATH(table._tbl)
 
     def _build_merge_map_for_html_enhanced(
         self, merged_cells: List[Dict], num_cols: int
@@ -756,59 +1540,58 @@ class DocFileParser:
                         }
         return merge_map
 
-    def _generate_html_header_rows_enhanced(
+    def _iter_table_html_lines(
         self,
-        table: Table,
-        html: List[str],
+        output_texts: List[List[str]],
         merge_map: Dict[int, Dict],
-        header_mapping: Dict[int, str],
-    ):
-        """生成增强的HTML表头行，正确处理表头行数"""
-        # 检测表头行数
-        header_rows = self._detect_header_rows_smart(table)
-
-        # 只生成表头行
-        for row_idx in range(header_rows):
-            if row_idx >= len(table.rows):
-                break
-            row = table.rows[row_idx]
-            html.append("<tr>")
-            for col_idx, cell in enumerate(row.cells):
-                if col_idx in merge_map and merge_map[col_idx]["is_merged"]:
-                    # 合并单元格
-                    colspan = merge_map[col_idx]["colspan"]
-                    text = merge_map[col_idx]["text"]
-                    html.append(f'<th colspan="{colspan}">{text}</th>')
-                elif col_idx in merge_map and not merge_map[col_idx]["is_merged"]:
-                    # 被合并的单元格，跳过
-                    continue
-                else:
-                    # 普通单元格
-                    cell_text = cell.text.strip()
-                    html.append(f"<th>{cell_text if cell_text else '-'}</th>")
-            html.append("</tr>")
-
-    def _generate_html_body_rows_enhanced(
-        self, table: Table, html: List[str], merge_map: Dict[int, Dict]
-    ):
-        """生成增强的HTML表体行，正确处理表头行数"""
-        # 检测表头行数
-        header_rows = self._detect_header_rows_smart(table)
+        header_rows: int,
+    ) -> Iterator[str]:
+        """
+        逐行产出增强的HTML表格（含首尾table标签），output_texts 为各行已转义的单元格文本。
+        前 header_rows 行为表头行（处理合并单元格），其余为表体行
+        """
+        # 表头行各列的输出方式在每个表头行中相同，预先算好：
+        # 合并起始列为带colspan的表头片段，被合并的列为""（跳过），普通列为None
+        header_width = max((len(row) for row in output_texts[:header_rows]), default=0)
+        header_plan: List[Optional[str]] = [None] * header_width
+        for col, merge_info in merge_map.items():
+            if col < header_width:
+                header_plan[col] = (
+                    _HTML_TH_COLSPAN(
+                        merge_info["colspan"], _escape_html_cell(merge_info["text"])
+                    )
+                    if merge_info["is_merged"]
+                    else ""
+                )
 
-        # 从表头行之后开始生成表体行
-        for row_idx in range(header_rows, len(table.rows)):
-            row = table.rows[row_idx]
-            html.append("<tr>")
-            for col_idx, cell in enumerate(row.cells):
-                cell_text = cell.text.strip()
-                html.append(f"<td>{cell_text if cell_text else '-'}</td>")
-            html.append("</tr>")
+        yield "<table border='1'>"
+        # 每行片段先收集再整体拼接，逐行产出
+        for row_idx, cell_texts in enumerate(output_texts):
+            if row_idx < header_rows:
+                row_html = [
+                    "<tr>",
+                    *[
+                        _HTML_TH(cell_text or "-") if fragment is None else fragment
+                        for cell_text, fragment in zip(cell_texts, header_plan)
+                        if fragment != ""
+                    ],
+                    "</tr>",
+                ]
+            else:
+                row_html = [
+                    "<tr>",
+                    *[_HTML_TD(text or "-") for text in cell_texts],
+                    "</tr>",
+                ]
+            yield "\n".join(row_html)
+        yield "</table>"
 
     def _table_to_html_with_merge_fallback(
         self, table: Table
     ) -> Tuple[str, List[str], List[Dict]]:
         """HTML转换的回退方法"""
-        if not table.rows:
+        rows = list(table.rows)
+        if not rows:
             return "<table></table>", [], []
 
         html = ["<table border='1'>"]
@@ -816,26 +1599,22 @@ class DocFileParser:
         merged_cells = []
 
         # 简单的表头处理
-        if table.rows:
-            headers = [cell.text.strip() for cell in table.rows[0].cells]
+        if rows:
+            headers = [cell.text.strip() for cell in rows[0].cells]
             html.append(
                 "<tr>"
                 + "".join(
-                    [f"<th>{header if header else '-'}</th>" for header in headers]
+                    [_HTML_TH(_escape_html_cell(header) or "-") for header in headers]
                 )
                 + "</tr>"
             )
 
         # 简单的表体处理
-        for row in table.rows[1:]:
+        for row in rows[1:]:
+            row_texts = [_escape_html_cell(cell.text.strip()) for cell in row.cells]
             html.append(
                 "<tr>"
-                + "".join(
-                    [
-                        f"<td>{cell.text.strip() if cell.text.strip() else '-'}</td>"
-                        for cell in row.cells
-                    ]
-                )
+                + "".join([_HTML_TD(text or "-") for text in row_texts])
                 + "</tr>"
             )
 
@@ -846,26 +1625,38 @@ class DocFileParser:
         self, table: Table
     ) -> Tuple[str, List[str], List[Dict]]:
         """增强的Markdown表格转换，体现合并单元格层次结构"""
-        if not table.rows:
+        texts = self._get_table_grid(table)["texts"]
+        if not texts:
             return "", [], []
 
-        # 构建表头映射（使用带回退机制的方法）
-        header_mapping = self._build_header_mapping_with_fallback(table)
+        # 表头行数、表头单元格与合并单元格信息只计算一次，供各辅助方法共用
+        header_rows = self._detect_header_rows_smart(table)
+        header_texts = texts[:header_rows]
+        merged_cells = (
+            self._get_merged_cells_info_ultra_enhanced(table)
+            if self._table_has_any_merge(table)
+            else []
+        )
 
-        # 获取合并单元格信息
-        merged_cells = self._get_merged_cells_info_ultra_enhanced(table)
+        # 构建表头映射（使用带回退机制的方法）
+        header_mapping = self._build_header_mapping_with_fallback(
+            table, header_texts, merged_cells
+        )
 
         # 生成最终表头
-        headers = []
-        for col in range(len(table.rows[0].cells)):
-            header = header_mapping.get(col, "")
-            headers.append(header)
+        headers = [header_mapping.get(col, "") for col in range(len(texts[0]))]
 
-        markdown_lines = []
+        markdown = "\n".join(
+            self._iter_table_markdown_lines(table, headers, header_rows)
+        )
+        return markdown, headers, merged_cells
 
+    def _iter_table_markdown_lines(
+        self, table: Table, headers: List[str], header_rows: int
+    ) -> Iterator[str]:
+        """逐行产出增强的Markdown表格：表头行、分隔线及过滤空行后的表体行"""
         # 表头 - 使用层次结构表头
-        header_row = "| " + " | ".join(headers) + " |"
-        markdown_lines.append(header_row)
+        yield "| " + " | ".join([_escape_markdown_cell(h) for h in headers]) + " |"
 
         # 分隔线 - 使用标准格式并添加对齐方式
         separator_cells = []
@@ -873,35 +1664,34 @@ class DocFileParser:
             # 根据数据类型确定对齐方式
             alignment = self._get_column_alignment_for_doc_enhanced(table, col)
             separator_cells.append(alignment)
-        separator_row = "| " + " | ".join(separator_cells) + " |"
-        markdown_lines.append(separator_row)
-
-        # 表体 - 过滤空行，确保数据行连续
-        header_rows = self._detect_header_rows_smart(table)
-        for row_idx in range(header_rows, len(table.rows)):
-            row = table.rows[row_idx]
-            # 检查当前行是否为空行
-            row_texts = [cell.text.strip() for cell in row.cells]
-            if any(text for text in row_texts):  # 只有当行中有非空数据时才添加
-                data_row = (
-                    "| "
-                    + " | ".join(
-                        [
-                            cell.text.strip() if cell.text.strip() else "-"
-                            for cell in row.cells
-                        ]
-                    )
-                    + " |"
-                )
-                markdown_lines.append(data_row)
-
-        return "\n".join(markdown_lines), headers, merged_cells
+        yield "| " + " | ".join(separator_cells) + " |"
+
+        # 表体 - 过滤空行，确保数据行连续；行文本与表格行分块共用
+        texts = self._get_table_grid(table)["texts"]
+        row_lines = self._get_markdown_row_lines(table)
+        for row_idx in range(header_rows, len(texts)):
+            # 只有当行中有非空数据时才添加
+            if any(texts[row_idx]):
+                yield row_lines[row_idx]
+
+    def _get_markdown_row_lines(self, table: Table) -> List[str]:
+        """各行的Markdown行文本（竖线已转义，空单元格以 "-" 占位），按表格缓存"""
+        grid = self._get_table_grid(table)
+        row_lines = grid.get("markdown_row_lines")
+        if row_lines is None:
+            row_lines = [
+                self._row_to_markdown(row_texts, [])
+                for row_texts in self._get_table_output_texts(table)
+            ]
+            grid["markdown_row_lines"] = row_lines
+        return row_lines
 
     def _table_to_markdown_with_merge_fallback(
         self, table: Table
     ) -> Tuple[str, List[str], List[Dict]]:
         """Markdown转换的回退方法"""
-        if not table.rows:
+        rows = list(table.rows)
+        if not rows:
             return "", [], []
 
         markdown_lines = []
@@ -909,12 +1699,11 @@ class DocFileParser:
         merged_cells = []
 
         # 简单的表头处理
-        if table.rows:
-            headers = [
-                cell.text.strip() if cell.text.strip() else "-"
-                for cell in table.rows[0].cells
-            ]
-            header_row = "| " + " | ".join(headers) + " |"
+        if rows:
+            headers = [cell.text.strip() or "-" for cell in rows[0].cells]
+            header_row = (
+                "| " + " | ".join([_escape_markdown_cell(h) for h in headers]) + " |"
+            )
             markdown_lines.append(header_row)
 
             # 分隔线 - 第一列左对齐，其他列右对齐
@@ -928,16 +1717,10 @@ class DocFileParser:
             markdown_lines.append(separator_row)
 
         # 简单的表体处理
-        for row in table.rows[1:]:
+        for row in rows[1:]:
+            row_texts = [_escape_markdown_cell(cell.text.strip()) for cell in row.cells]
             data_row = (
-                "| "
-                + " | ".join(
-                    [
-                        cell.text.strip() if cell.text.strip() else "-"
-                        for cell in row.cells
-                    ]
-                )
-                + " |"
+                "| " + " | ".join([text or "-" for text in row_texts]) + " |"
             )
             markdown_lines.append(data_row)
 
@@ -966,84 +1749,84 @@ class DocFileParser:
         """生成表格行分块，正确处理表头行数"""
         row_chunks = []
         header_rows = self._detect_header_rows_smart(table)
+        # 行内容使用按输出格式转义后的单元格文本
+        texts = self._get_table_output_texts(table)
+
+        # 输出格式与各行相同的元数据在循环外确定，每行只复制后填入行号
+        table_format = self.table_config.table_format
+        # Markdown行文本与完整表格的表体行相同，直接复用缓存
+        markdown_lines = (
+            self._get_markdown_row_lines(table) if table_format == "markdown" else None
+        )
+        metadata_template = {
+            "doc_id": doc_id,
+            "table_id": table_id,
+            "row": None,
+            "preceding_paragraph_index": preceding,
+            "following_paragraph_index": following,
+            "preceding_paragraph_content": preceding_content,
+            "following_paragraph_content": following_content,
+            "header": table_headers,
+            "parent_table_info": parent_info,
+            "table_format": table_format,
+        }
 
-        for r_idx in range(header_rows, len(table.rows)):
-            row = table.rows[r_idx]
-            row_content = self._row_to_format(row, table_headers)
+        for r_idx in range(header_rows, len(texts)):
+            metadata = metadata_template.copy()
+            metadata["row"] = r_idx + 1
             row_chunk = {
                 "type": "table_row",
-                "content": row_content,
-                "metadata": {
-                    "doc_id": doc_id,
-                    "table_id": table_id,
-                    "row": r_idx + 1,
-                    "preceding_paragraph_index": preceding,
-                    "following_paragraph_index": following,
-                    "preceding_paragraph_content": preceding_content,
-                    "following_paragraph_content": following_content,
-                    "header": table_headers,
-                    "parent_table_info": parent_info,
-                    "table_format": self.table_config.table_format,
-                },
+                "content": (
+                    markdown_lines[r_idx]
+                    if markdown_lines is not None
+                    else self._row_to_html(texts[r_idx], table_headers)
+                ),
+                "metadata": metadata,
                 "parent_id": table_id,
                 "context": context,
             }
             row_chunks.append(row_chunk)
         return row_chunks
 
-    def _row_to_format(self, row, headers: List[str]) -> str:
-        """根据配置将表格行转换为指定格式"""
+    def _row_to_format(self, cell_texts: List[str], headers: List[str]) -> str:
+        """根据配置将表格行（各单元格已转义的文本）转换为指定格式"""
         if self.table_config.table_format == "markdown":
-            return self._row_to_markdown(row, headers)
+            return self._row_to_markdown(cell_texts, headers)
         else:
-            return self._row_to_html(row, headers)
+            return self._row_to_html(cell_texts, headers)
 
-    def _row_to_html(self, row, headers: List[str]) -> str:
+    def _row_to_html(self, cell_texts: List[str], headers: List[str]) -> str:
         """生成单行HTML字符串"""
-        cells = [cell.text.strip() for cell in row.cells]
-        html = "<table border='1'><tr>"
-        for cell in cells:
-            html += f"<td>{cell if cell else '-'}</td>"
-        html += "</tr></table>"
-        return html
-
-    def _row_to_markdown(self, row, headers: List[str]) -> str:
+        if not cell_texts:
+            return "<table border='1'><tr></tr></table>"
+        # 单元格之间以 "</td><td>" 一次性拼接，不再逐个单元格套用模板
+        return (
+            "<table border='1'><tr><td>"
+            + "</td><td>".join([text or "-" for text in cell_texts])
+            + "</td></tr></table>"
+        )
+
+    def _row_to_markdown(self, cell_texts: List[str], headers: List[str]) -> str:
         """生成单行Markdown字符串"""
         # 修复：过滤空值，确保生成的markdown格式正确
-        cells = []
-        for cell in row.cells:
-            text = cell.text.strip()
-            if text:
-                cells.append(text)
-            else:
-                cells.append("-")
-        markdown = "| " + " | ".join(cells) + " |"
-        return markdown
+        return "| " + " | ".join([text or "-" for text in cell_texts]) + " |"
 
     def _get_cell_span(self, cell) -> Tuple[int, int]:
         # 检测合并单元格的行/列跨度
         tc = cell._tc
         rowspan = 1
         colspan = 1
-        gridspan = tc.xpath(".//w:gridSpan")
-        if gridspan:
+        gridspan, vmerge = _find_cell_merge_marks(tc)
+        if gridspan is not None:
             try:
-                colspan = int(
-                    gridspan[0].get(
-                        "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val"
-                    )
-                )
+                colspan = int(gridspan.get(_W_VAL))
             except Exception:
                 colspan = 1
-        vmerge = tc.xpath(".//w:vMerge")
-        if vmerge:
+        if vmerge is not None:
             # 只在合并起始单元格上标注
-            val = vmerge[0].get(
-                "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val"
-            )
+            val = vmerge.get(_W_VAL)
             if val == "restart":
-                # 统计向下合并了多少行（简单实现，复杂表格需更精细处理）
-                rowspan = 2  # 这里只能简单标注2行，复杂情况需更复杂逻辑
+                rowspan = _vertical_merge_rowspan(tc)
         return rowspan, colspan
 
     def _get_cell_span_enhanced(self, cell) -> Tuple[int, int, bool, str]:
@@ -1058,23 +1841,16 @@ class DocFileParser:
         parent_text = cell.text.strip()
 
         # 检测水平合并（colspan）
-        gridspan = tc.xpath(".//w:gridSpan")
-        if gridspan:
+        gridspan, vmerge = _find_cell_merge_marks(tc)
+        if gridspan is not None:
             try:
-                colspan = int(
-                    gridspan[0].get(
-                        "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val"
-                    )
-                )
+                colspan = int(gridspan.get(_W_VAL))
             except (ValueError, TypeError):
                 colspan = 1
 
         # 检测垂直合并（rowspan）
-        vmerge = tc.xpath(".//w:vMerge")
-        if vmerge:
-            val = vmerge[0].get(
-                "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val"
-            )
+        if vmerge is not None:
+            val = vmerge.get(_W_VAL)
             if val == "restart":
                 # 合并起始单元格
                 is_merged_start = True
@@ -1092,12 +1868,21 @@ class DocFileParser:
         # 实际应用中可能需要更复杂的逻辑
         return 2  # 默认返回2，复杂情况需要更精细的处理
 
+    def _iter_block_elements(self, parent):
+        """依次遍历正文中的段落和表格元素，产出 ("p" | "tbl", 元素)"""
+        # 由 lxml 按完整限定名过滤子元素，只需区分表格与段落
+        for child in parent.element.body.iterchildren(_W_P, _W_TBL):
+            if child.tag == _W_TBL:
+                yield "tbl", child
+            else:
+                yield "p", child
+
     def _iter_block_items(self, parent):
         # 依次遍历段落和表格
-        for child in parent.element.body.iterchildren():
-            if child.tag.endswith("tbl"):
+        for kind, child in self._iter_block_elements(parent):
+            if kind == "tbl":
                 yield Table(child, parent)
-            elif child.tag.endswith("p"):
+            else:
                 yield Paragraph(child, parent)
 
     @classmethod
@@ -1117,12 +1902,21 @@ class DocFileParser:
             return paragraphs[idx - 1]
         return None
 
-    def _get_context_for_paragraph(self, paragraphs: List[str], idx: int) -> str:
+    def _get_neighbor_paragraphs(
+        self, paragraphs: List[str], idx: int
+    ) -> Tuple[str, str]:
         """
-        获取指定段落的上下文（前后段落内容），idx为0-based。
+        获取指定段落的前后段落内容，idx为0-based，不存在时为空字符串。
         """
         prev_para = paragraphs[idx - 1] if idx > 0 else ""
         next_para = paragraphs[idx + 1] if idx < len(paragraphs) - 1 else ""
+        return prev_para, next_para
+
+    def _get_context_for_paragraph(self, paragraphs: List[str], idx: int) -> str:
+        """
+        获取指定段落的上下文（前后段落内容），idx为0-based。
+        """
+        prev_para, next_para = self._get_neighbor_paragraphs(paragraphs, idx)
         context = f"上一段：{prev_para}。下一段：{next_para}"
         return context
 
@@ -1171,19 +1965,22 @@ class DocFileParser:
     ):
         """异步处理图片分析"""
         try:
-            # 为每个图片收集上下文
-            for image_chunk in image_chunks:
-                context = self.context_collector.collect_context_for_image(
-                    image_chunk, all_chunks
-                )
+            # 为所有图片批量收集上下文（文档标题与块位置只计算一次）
+            contexts = self.context_collector.collect_contexts_for_images(
+                image_chunks, all_chunks
+            )
+            for image_chunk, context in zip(image_chunks, contexts):
                 # 方案一：保持完整的上下文结构，不立即格式化
                 image_chunk["context"] = context
 
-            # 并发分析所有图片
-            tasks = []
-            for image_chunk in image_chunks:
-                task = self._analyze_single_image_async(image_chunk)
-                tasks.append(task)
+            # 并发分析所有图片，使用信号量限制同时进行的视觉模型调用数
+            semaphore = asyncio.Semaphore(max(1, self.image_max_concurrent))
+
+            async def analyze_with_limit(image_chunk: Dict):
+                async with semaphore:
+                    await self._analyze_single_image_async(image_chunk)
+
+            tasks = [analyze_with_limit(image_chunk) for image_chunk in image_chunks]
 
             # 等待所有分析完成
             await asyncio.gather(*tasks, return_exceptions=True)
@@ -1233,11 +2030,11 @@ class DocFileParser:
 
     def _extract_table_data(self, table: Table) -> List[List[Dict]]:
         """提取表格数据"""
+        grid = self._get_table_grid(table)
         rows = []
-        for r_idx, row in enumerate(table.rows):
+        for r_idx, (cells, texts) in enumerate(zip(grid["cells"], grid["texts"])):
             row_cells = []
-            for c_idx, cell in enumerate(row.cells):
-                text = cell.text.strip()
+            for c_idx, (cell, text) in enumerate(zip(cells, texts)):
                 rowspan, colspan = self._get_cell_span(cell)
                 cell_info = {
                     "text": text,
@@ -1252,14 +2049,15 @@ class DocFileParser:
 
     def _get_merged_cells_info(self, table: Table) -> List[Dict]:
         """获取合并单元格信息"""
+        grid = self._get_table_grid(table)
         merged_cells = []
-        for r_idx, row in enumerate(table.rows):
-            for c_idx, cell in enumerate(row.cells):
+        for r_idx, (cells, texts) in enumerate(zip(grid["cells"], grid["texts"])):
+            for c_idx, cell in enumerate(cells):
                 rowspan, colspan = self._get_cell_span(cell)
                 if rowspan > 1 or colspan > 1:
                     merged_cells.append(
                         {
-                            "text": cell.text.strip(),
+                            "text": texts[c_idx],
                             "rowspan": rowspan,
                             "colspan": colspan,
                             "row": r_idx,
@@ -1274,6 +2072,7 @@ class DocFileParser:
         """
         header_mapping = {}
         merged_cells = self._get_merged_cells_info_enhanced(table)
+        num_cols = len(self._get_table_grid(table)["cells"][0])
 
         # 处理合并单元格
         for merge_info in merged_cells:
@@ -1285,7 +2084,7 @@ class DocFileParser:
                 # 为合并单元格的子列分配表头
                 for col_offset in range(colspan):
                     col = start_col + col_offset
-                    if col < len(table.rows[0].cells):
+                    if col < num_cols:
                         # 获取子列的表头信息
                         child_header = self._get_child_header_for_doc(
                             table, col, parent_text
@@ -1293,7 +2092,7 @@ class DocFileParser:
                         header_mapping[col] = child_header
 
         # 处理未合并的列
-        for col in range(len(table.rows[0].cells)):
+        for col in range(num_cols):
             if col not in header_mapping:
                 header = self._get_single_column_header_for_doc(table, col)
                 header_mapping[col] = header
@@ -1303,8 +2102,8 @@ class DocFileParser:
     def _get_merged_cells_info_enhanced(self, table: Table) -> List[Dict]:
         """获取增强的合并单元格信息"""
         merged_cells = []
-        for r_idx, row in enumerate(table.rows):
-            for c_idx, cell in enumerate(row.cells):
+        for r_idx, cells in enumerate(self._get_table_grid(table)["cells"]):
+            for c_idx, cell in enumerate(cells):
                 rowspan, colspan, is_merged_start, parent_text = (
                     self._get_cell_span_enhanced(cell)
                 )
@@ -1322,17 +2121,32 @@ class DocFileParser:
         return merged_cells
 
     def _get_cell_span_ultra_enhanced(
-        self, cell, table: Table, row_idx: int, col_idx: int
+        self,
+        cell,
+        table: Table,
+        row_idx: int,
+        col_idx: int,
+        cell_text: Optional[str] = None,
     ) -> Tuple[int, int, bool, str, Dict]:
         """
-        超增强的合并单元格检测
+        超增强的合并单元格检测，cell_text 为已提取的去空白单元格文本（可选）
         返回: (rowspan, colspan, is_merged_start, parent_text, merge_info)
         """
-        tc = cell._tc
+        return self._get_tc_span_ultra_enhanced(
+            cell._tc,
+            table,
+            row_idx,
+            col_idx,
+            cell.text.strip() if cell_text is None else cell_text,
+        )
+
+    def _get_tc_span_ultra_enhanced(
+        self, tc, table: Table, row_idx: int, col_idx: int, parent_text: str
+    ) -> Tuple[int, int, bool, str, Dict]:
+        """直接基于 w:tc 元素的合并单元格检测，返回值同 _get_cell_span_ultra_enhanced"""
         rowspan = 1
         colspan = 1
         is_merged_start = False
-        parent_text = cell.text.strip()
         merge_info = {
             "row": row_idx,
             "col": col_idx,
@@ -1344,25 +2158,18 @@ class DocFileParser:
         }
 
         # 检测水平合并（colspan）
-        gridspan = tc.xpath(".//w:gridSpan")
-        if gridspan:
+        gridspan, vmerge = _find_cell_merge_marks(tc)
+        if gridspan is not None:
             try:
-                colspan = int(
-                    gridspan[0].get(
-                        "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val"
-                    )
-                )
+                colspan = int(gridspan.get(_W_VAL))
                 merge_info["colspan"] = colspan
                 merge_info["merge_type"] = "horizontal"
             except (ValueError, TypeError):
                 colspan = 1
 
         # 检测垂直合并（rowspan）- 通过遍历后续行来判断
-        vmerge = tc.xpath(".//w:vMerge")
-        if vmerge:
-            val = vmerge[0].get(
-                "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val"
-            )
+        if vmerge is not None:
+            val = vmerge.get(_W_VAL)
             if val == "restart":
                 # 合并起始单元格
                 is_merged_start = True
@@ -1385,73 +2192,107 @@ class DocFileParser:
 
     def _calculate_actual_rowspan(self, table: Table, start_row: int, col: int) -> int:
         """计算单元格实际合并的行数"""
-        rowspan = 1
-        # 从下一行开始检查，直到找到非空单元格或到达表格末尾
-        for row_idx in range(start_row + 1, len(table.rows)):
-            if col < len(table.rows[row_idx].cells):
-                cell = table.rows[row_idx].cells[col]
-                # 检查该单元格是否被垂直合并
+        # 从下一行开始连续可并入的行数（遇到非空单元格、非continue标记或表格末尾即止）
+        extents = self._get_vertical_merge_extents(table)
+        next_row = start_row + 1
+        if next_row < len(extents) and col < len(extents[next_row]):
+            return 1 + extents[next_row][col]
+        return 1
+
+    def _get_vertical_merge_extents(self, table: Table) -> List[List[int]]:
+        """
+        自底向上一次扫描整表，计算每个单元格起向下连续可并入纵向合并的行数，按表格缓存。
+        可并入：vMerge 为 continue，或没有 vMerge 标记且单元格为空
+        """
+        analysis = self._get_table_analysis(table)
+        extents = analysis.get("vertical_merge_extents")
+        if extents is not None:
+            return extents
+
+        grid = self._get_table_grid(table)
+        cells, texts = grid["cells"], grid["texts"]
+        extents = [[] for _ in cells]
+        mergeable_by_tc = {}
+        below: List[int] = []
+        for row_idx in range(len(cells) - 1, -1, -1):
+            row_extents = []
+            for col, cell in enumerate(cells[row_idx]):
                 tc = cell._tc
-                vmerge = tc.xpath(".//w:vMerge")
-                if vmerge:
-                    val = vmerge[0].get(
-                        "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val"
-                    )
-                    if val == "continue":
-                        rowspan += 1
+                mergeable = mergeable_by_tc.get(tc)
+                if mergeable is None:
+                    vmerge = _find_cell_merge_marks(tc)[1]
+                    if vmerge is not None:
+                        mergeable = vmerge.get(_W_VAL) == "continue"
                     else:
-                        break
+                        # 如果没有vMerge标记，检查单元格是否有内容
+                        mergeable = not texts[row_idx][col]
+                    mergeable_by_tc[tc] = mergeable
+                if mergeable:
+                    row_extents.append(1 + (below[col] if col < len(below) else 0))
                 else:
-                    # 如果没有vMerge标记，检查单元格是否有内容
-                    if cell.text.strip():
-                        break
-                    else:
-                        rowspan += 1
-            else:
-                break
-        return rowspan
+                    row_extents.append(0)
+            extents[row_idx] = below = row_extents
+        analysis["vertical_merge_extents"] = extents
+        return extents
 
     def _get_child_header_for_doc(
         self, table: Table, col: int, parent_text: str
     ) -> str:
         """获取合并单元格子列的表头"""
-        # 获取该列在表头行的所有非空值
-        header_parts = []
-        for row_idx, row in enumerate(table.rows):
-            if col < len(row.cells):
-                cell_value = row.cells[col].text.strip()
-                if cell_value:
-                    header_parts.append(cell_value)
+        # 获取该列的所有非空值（缓存中的共享列表，只读）
+        header_parts = self._get_column_nonempty_texts(table).get(col, [])
 
         # 构建层次结构表头
-        if header_parts:
-            if parent_text not in header_parts:
-                header_parts.insert(0, parent_text)
-            return "/".join(header_parts)
-        else:
+        if not header_parts:
             return parent_text
+        if parent_text and parent_text not in header_parts:
+            return parent_text + "/" + "/".join(header_parts)
+        return "/".join(header_parts)
 
     def _get_single_column_header_for_doc(self, table: Table, col: int) -> str:
         """获取单列的表头"""
-        header_parts = []
-        for row_idx, row in enumerate(table.rows):
-            if col < len(row.cells):
-                cell_value = row.cells[col].text.strip()
-                if cell_value:
-                    header_parts.append(cell_value)
-
+        header_parts = self._get_column_nonempty_texts(table).get(col, [])
         return "/".join(header_parts) if header_parts else ""
 
+    def _get_column_nonempty_texts(self, table: Table) -> Dict[int, List[str]]:
+        """一次遍历单元格文本，按列收集所有非空值（自上而下），按表格缓存"""
+        analysis = self._get_table_analysis(table)
+        column_texts = analysis.get("column_nonempty_texts")
+        if column_texts is None:
+            column_texts = {}
+            for row_texts in self._get_table_grid(table)["texts"]:
+                for col, text in enumerate(row_texts):
+                    if text:
+                        column_texts.setdefault(col, []).append(text)
+            analysis["column_nonempty_texts"] = column_texts
+        return column_texts
+
+    def _get_table_analysis(self, table: Table) -> Dict:
+        """获取表格对应的分析结果缓存字典"""
+        return self._table_analysis_cache.setdefault(table._tbl, {})
+
     def _detect_header_rows_smart(self, table: Table) -> int:
+        """智能表头行检测，同一表格只检测一次"""
+        analysis = self._get_table_analysis(table)
+        if "header_rows" not in analysis:
+            analysis["header_rows"] = self._detect_header_rows_by_voting(table)
+        return analysis["header_rows"]
+
+    def _detect_header_rows_by_voting(self, table: Table) -> int:
         """智能表头行检测，基于多种特征"""
-        if not table.rows:
+        num_rows = len(self._get_table_grid(table)["rows"])
+        if not num_rows:
             return 0
+        # 各方法最多检测 min(3, 行数) 行，单行表格的结果必为1
+        if num_rows == 1:
+            return 1
 
-        # 使用多种方法检测表头行数
+        # 使用多种方法检测表头行数；投票结果与顺序无关，
+        # 开销最大的合并单元格检测（遍历全表）放在最后
         methods = [
-            self._detect_header_rows_by_merge_enhanced,
             self._detect_header_rows_by_content_pattern,
             self._detect_header_rows_by_structure_enhanced,
+            self._detect_header_rows_by_merge_enhanced,
         ]
 
         results = []
@@ -1462,130 +2303,100 @@ class DocFileParser:
                     results.append(result)
             except Exception:
                 continue
-
-        # 使用投票机制确定最终结果
-        if results:
-            # 取众数，如果没有众数则取中位数
-            from collections import Counter
-
-            counter = Counter(results)
-            most_common = counter.most_common(1)
-            if most_common[0][1] > 1:  # 如果有多个相同的结果
-                return most_common[0][0]
-            else:
-                return sorted(results)[len(results) // 2]  # 中位数
-
-        return 1  # 默认返回1
+            # 已有两个相同结果即为众数，第三个方法无法改变投票结果
+            if len(results) == 2 and results[0] == results[1]:
+                return results[0]
+
+        # 使用投票机制确定最终结果：取众数，如果没有众数则取中位数。
+        # 前两个结果相同时已提前返回，此处众数只可能是第三个结果
+        if not results:
+            return 1  # 默认返回1
+        if len(results) == 3 and results[2] in (results[0], results[1]):
+            return results[2]
+        return sorted(results)[len(results) // 2]  # 中位数
 
     def _detect_header_rows_by_merge_enhanced(self, table: Table) -> int:
         """增强的基于合并单元格分布检测表头行"""
-        if not table.rows:
+        grid = self._get_table_grid(table)
+        if not grid["rows"]:
             return 0
 
-        # 统计每行的合并单元格数量和类型
-        merge_stats = []
-        for row_idx, row in enumerate(table.rows):
-            horizontal_merges = 0
-            vertical_merges = 0
-            total_merges = 0
-
-            for col_idx, cell in enumerate(row.cells):
-                _, _, _, _, merge_info = self._get_cell_span_ultra_enhanced(
-                    cell, table, row_idx, col_idx
-                )
-
-                if merge_info["merge_type"] in ["horizontal", "both"]:
-                    horizontal_merges += 1
-                if merge_info["merge_type"] in ["vertical", "both"]:
-                    vertical_merges += 1
-                if merge_info["merge_type"] != "none":
-                    total_merges += 1
-
-            merge_stats.append(
-                {
-                    "horizontal": horizontal_merges,
-                    "vertical": vertical_merges,
-                    "total": total_merges,
-                }
-            )
+        # 没有任何合并单元格时结果必为1，无需逐单元格统计
+        if not self._table_has_any_merge(table):
+            return 1
 
-        # 检测表头行
+        # 只有前 min(3, 行数) 行参与判定：自首行起连续含有合并单元格的行视为表头行，
+        # 某行只要出现一个合并单元格即可判定，无需统计整表各行的合并数量
         header_rows = 0
-        max_header_rows = min(3, len(table.rows))
-
-        for row_idx in range(max_header_rows):
-            stats = merge_stats[row_idx]
-            # 如果水平合并较多，可能是表头行
-            if stats["horizontal"] > 0 or stats["total"] > 0:
-                header_rows += 1
-            else:
+        for row_idx, row_cells in enumerate(grid["cells"][:3]):
+            row_texts = grid["texts"][row_idx]
+            has_merge = any(
+                self._get_cell_span_ultra_enhanced(
+                    cell, table, row_idx, col_idx, row_texts[col_idx]
+                )[4]["merge_type"]
+                != "none"
+                for col_idx, cell in enumerate(row_cells)
+            )
+            if not has_merge:
                 break
+            header_rows += 1
 
         return header_rows if header_rows > 0 else 1
 
     def _detect_header_rows_by_content_pattern(self, table: Table) -> int:
         """基于内容模式检测表头行"""
-        if not table.rows:
+        texts = self._get_table_grid(table)["texts"]
+        if not texts:
             return 0
 
         header_rows = 0
-        max_header_rows = min(3, len(table.rows))
+        max_header_rows = min(3, len(texts))
 
         for row_idx in range(max_header_rows):
-            row = table.rows[row_idx]
-            if self._is_header_row_by_content_pattern(row, row_idx):
+            if self._is_header_row_by_content_pattern(texts[row_idx], row_idx):
                 header_rows += 1
             else:
                 break
 
         return header_rows if header_rows > 0 else 1
 
-    def _is_header_row_by_content_pattern(self, row, row_idx: int) -> bool:
-        """基于内容模式判断是否为表头行"""
-        # 检查是否包含常见的表头关键词
-        header_keywords = [
-            "年度",
-            "年份",
-            "学校",
-            "名称",
-            "情况",
-            "人数",
-            "合计",
-            "备注",
-        ]
+    def _is_header_row_by_content_pattern(
+        self, cell_texts: List[str], row_idx: int
+    ) -> bool:
+        """基于内容模式判断是否为表头行，cell_texts 为该行去除首尾空白的单元格文本"""
+        total_cells = len(cell_texts)
+        if total_cells == 0:
+            return False
 
-        cell_texts = [cell.text.strip() for cell in row.cells]
+        # 检查是否包含常见的表头关键词；
+        # 超过30%的单元格包含表头关键词即可判定为表头行，无需继续统计
         keyword_count = 0
-
         for text in cell_texts:
-            for keyword in header_keywords:
-                if keyword in text:
-                    keyword_count += 1
-                    break
-
-        # 如果超过30%的单元格包含表头关键词，可能是表头行
-        if len(cell_texts) > 0 and keyword_count / len(cell_texts) > 0.3:
-            return True
+            if _HEADER_KEYWORD_RE.search(text):
+                keyword_count += 1
+                if keyword_count / total_cells > 0.3:
+                    return True
 
-        # 检查是否包含数值（数据行通常包含数值）
+        # 检查是否包含数值（数据行通常包含数值）；
+        # 数值比例一旦达到30%即可判定不是表头行
         numeric_count = 0
         for text in cell_texts:
             if text and self._is_numeric(text):
                 numeric_count += 1
+                if not numeric_count / total_cells < 0.3:
+                    return False
 
-        # 如果数值比例较低，可能是表头行
-        if len(cell_texts) > 0 and numeric_count / len(cell_texts) < 0.3:
-            return True
-
-        return False
+        # 数值比例较低，可能是表头行
+        return True
 
     def _is_numeric(self, text: str) -> bool:
         """判断文本是否为数值"""
         try:
             # 移除常见的非数值字符
-            cleaned_text = (
-                text.replace(",", "").replace("%", "").replace("+", "").replace("-", "")
-            )
+            cleaned_text = text.translate(_NUMERIC_STRIP_TABLE)
+            if _PLAIN_NUMBER_RE.fullmatch(cleaned_text):
+                return True
+            # 科学计数法、全角数字等少见写法仍交给 float 判断
             float(cleaned_text)
             return True
         except (ValueError, TypeError):
@@ -1593,28 +2404,33 @@ class DocFileParser:
 
     def _detect_header_rows_by_structure_enhanced(self, table: Table) -> int:
         """增强的基于行结构特征检测表头行"""
-        if not table.rows:
+        grid = self._get_table_grid(table)
+        rows, cells, texts = grid["rows"], grid["cells"], grid["texts"]
+        if not rows:
             return 0
 
         header_rows = 0
-        max_header_rows = min(3, len(table.rows))
+        max_header_rows = min(3, len(rows))
 
         for row_idx in range(max_header_rows):
-            row = table.rows[row_idx]
-            if self._is_header_row_by_structure_enhanced(row, row_idx):
+            if self._is_header_row_by_structure_enhanced(
+                rows[row_idx], row_idx, cells[row_idx], texts[row_idx]
+            ):
                 header_rows += 1
             else:
                 break
 
         return header_rows if header_rows > 0 else 1
 
-    def _is_header_row_by_structure_enhanced(self, row, row_idx: int) -> bool:
-        """增强的基于结构特征判断是否为表头行"""
+    def _is_header_row_by_structure_enhanced(
+        self, row, row_idx: int, row_cells: List, cell_texts: List[str]
+    ) -> bool:
+        """增强的基于结构特征判断是否为表头行，row_cells/cell_texts 为该行单元格及其文本"""
         # 检查合并单元格分布
         merge_count = 0
-        for col_idx, cell in enumerate(row.cells):
+        for col_idx, cell in enumerate(row_cells):
             _, _, _, _, merge_info = self._get_cell_span_ultra_enhanced(
-                cell, row, row_idx, col_idx
+                cell, row, row_idx, col_idx, cell_texts[col_idx]
             )
             if merge_info["merge_type"] != "none":
                 merge_count += 1
@@ -1625,9 +2441,9 @@ class DocFileParser:
 
         # 检查单元格内容的特征
         empty_cells = 0
-        total_cells = len(row.cells)
-        for cell in row.cells:
-            if not cell.text.strip():
+        total_cells = len(cell_texts)
+        for text in cell_texts:
+            if not text:
                 empty_cells += 1
 
         # 如果空单元格比例较低，可能是表头行
@@ -1648,37 +2464,23 @@ class DocFileParser:
         return header_rows_by_structure
 
     def _get_child_header_for_doc_fixed(
-        self, table: Table, col: int, parent_text: str, header_rows: int
+        self, col: int, parent_text: str, column_headers: Dict[int, List[str]]
     ) -> str:
-        """修复后的子列表头获取方法，只处理表头行"""
-        # 只处理表头行，不包含数据行
-        header_parts = []
-        for row_idx in range(header_rows):
-            if row_idx < len(table.rows) and col < len(table.rows[row_idx].cells):
-                cell_value = table.rows[row_idx].cells[col].text.strip()
-                if cell_value:
-                    header_parts.append(cell_value)
+        """修复后的子列表头获取方法，column_headers 为各列在表头行中的非空文本"""
+        header_parts = column_headers.get(col, [])
 
         # 构建层次结构表头
-        if header_parts:
-            if parent_text not in header_parts:
-                header_parts.insert(0, parent_text)
-            return "/".join(header_parts)
-        else:
+        if not header_parts:
             return parent_text
+        if parent_text and parent_text not in header_parts:
+            return parent_text + "/" + "/".join(header_parts)
+        return "/".join(header_parts)
 
     def _get_single_column_header_for_doc_fixed(
-        self, table: Table, col: int, header_rows: int
+        self, col: int, column_headers: Dict[int, List[str]]
     ) -> str:
-        """修复后的单列表头获取方法，只处理表头行"""
-        header_parts = []
-        for row_idx in range(header_rows):
-            if row_idx < len(table.rows) and col < len(table.rows[row_idx].cells):
-                cell_value = table.rows[row_idx].cells[col].text.strip()
-                if cell_value:
-                    header_parts.append(cell_value)
-
-        return "/".join(header_parts) if header_parts else ""
+        """修复后的单列表头获取方法，column_headers 为各列在表头行中的非空文本"""
+        return "/".join(column_headers.get(col, []))
 
     def _build_header_mapping_for_doc_fixed(self, table: Table) -> Dict[int, str]:
         """修复后的表头映射构建，正确处理表头行"""
@@ -1687,6 +2489,11 @@ class DocFileParser:
 
         header_mapping = {}
         merged_cells = self._get_merged_cells_info_enhanced(table)
+        num_cols = len(self._get_table_grid(table)["cells"][0])
+        # 逐行一次收集各列在表头行中的非空文本，各列取表头时直接查表
+        column_headers = self._build_header_hierarchy_for_doc(
+            table, self._get_table_grid(table)["texts"][:header_rows]
+        )
 
         # 处理合并单元格
         for merge_info in merged_cells:
@@ -1698,112 +2505,127 @@ class DocFileParser:
                 # 为合并单元格的子列分配表头
                 for col_offset in range(colspan):
                     col = start_col + col_offset
-                    if col < len(table.rows[0].cells):
+                    if col < num_cols:
                         # 获取子列的表头信息
                         child_header = self._get_child_header_for_doc_fixed(
-                            table, col, parent_text, header_rows
+                            col, parent_text, column_headers
                         )
                         header_mapping[col] = child_header
 
         # 处理未合并的列
-        for col in range(len(table.rows[0].cells)):
+        for col in range(num_cols):
             if col not in header_mapping:
                 header = self._get_single_column_header_for_doc_fixed(
-                    table, col, header_rows
+                    col, column_headers
                 )
                 header_mapping[col] = header
 
         return header_mapping
 
-    def _build_header_hierarchy_for_doc(self, table: Table) -> Dict[int, List[str]]:
-        """构建表头层次结构，正确处理多级表头"""
-        header_rows = self._detect_header_rows_smart(table)
-        header_hierarchy = {}
-
-        # 为每列构建表头层次
-        for col in range(len(table.rows[0].cells)):
-            column_headers = []
-
-            # 收集该列在表头行中的内容
-            for row_idx in range(header_rows):
-                if row_idx < len(table.rows) and col < len(table.rows[row_idx].cells):
-                    cell_text = table.rows[row_idx].cells[col].text.strip()
-                    if cell_text:
-                        column_headers.append(cell_text)
+    def _build_header_hierarchy_for_doc(
+        self, table: Table, header_texts: Optional[List[List[str]]] = None
+    ) -> Dict[int, List[str]]:
+        """构建表头层次结构，正确处理多级表头
 
-            header_hierarchy[col] = column_headers
+        header_texts 为调用方预先取出的各表头行单元格文本，缺省时按表格检测
+        """
+        texts = self._get_table_grid(table)["texts"]
+        if header_texts is None:
+            header_texts = texts[: self._detect_header_rows_smart(table)]
+        num_cols = len(texts[0])
+        header_hierarchy = {col: [] for col in range(num_cols)}
+
+        # 逐行一次遍历表头行，按列收集非空内容
+        for cell_texts in header_texts:
+            for col, cell_text in enumerate(cell_texts[:num_cols]):
+                if cell_text:
+                    header_hierarchy[col].append(cell_text)
 
         return header_hierarchy
 
-    def _build_header_mapping_ultra_enhanced(self, table: Table) -> Dict[int, str]:
+    def _build_header_mapping_ultra_enhanced(
+        self,
+        table: Table,
+        header_texts: Optional[List[List[str]]] = None,
+        merged_cells: Optional[List[Dict]] = None,
+    ) -> Dict[int, str]:
         """超增强的表头映射构建"""
         # 获取表头层次结构
-        header_hierarchy = self._build_header_hierarchy_for_doc(table)
+        header_hierarchy = self._build_header_hierarchy_for_doc(table, header_texts)
 
         # 获取合并单元格信息
-        merged_cells = self._get_merged_cells_info_ultra_enhanced(table)
-
-        header_mapping = {}
+        if merged_cells is None:
+            merged_cells = self._get_merged_cells_info_ultra_enhanced(table)
+        num_cols = len(self._get_table_grid(table)["cells"][0])
 
-        # 处理合并单元格
+        # 先记下各列所属的合并起始单元格文本（多个合并覆盖同一列时以后者为准）
+        parent_text_by_col: Dict[int, str] = {}
         for merge_info in merged_cells:
             if merge_info["is_merged_start"]:
-                parent_text = merge_info["text"]
                 start_col = merge_info["col"]
-                colspan = merge_info["colspan"]
+                end_col = min(start_col + merge_info["colspan"], num_cols)
+                for col in range(start_col, end_col):
+                    parent_text_by_col[col] = merge_info["text"]
 
-                # 为合并单元格的子列分配表头
-                for col_offset in range(colspan):
-                    col = start_col + col_offset
-                    if col < len(table.rows[0].cells):
-                        # 获取子列的表头信息
-                        child_header = self._get_child_header_ultra_enhanced(
-                            table, col, parent_text, header_hierarchy
-                        )
-                        header_mapping[col] = child_header
-
-        # 处理未合并的列
-        for col in range(len(table.rows[0].cells)):
-            if col not in header_mapping:
+        # 再逐列一次生成表头：合并单元格的子列带上父表头，其余列直接取层次结构
+        header_mapping = {}
+        for col in range(num_cols):
+            if col in parent_text_by_col:
+                header = self._get_child_header_ultra_enhanced(
+                    col, parent_text_by_col[col], header_hierarchy
+                )
+            else:
                 header = self._get_single_column_header_ultra_enhanced(
-                    table, col, header_hierarchy
+                    col, header_hierarchy
                 )
-                header_mapping[col] = header
+            header_mapping[col] = header
 
         return header_mapping
 
     def _get_merged_cells_info_ultra_enhanced(self, table: Table) -> List[Dict]:
-        """获取超增强的合并单元格信息"""
+        """获取超增强的合并单元格信息，结果按表格缓存"""
+        analysis = self._get_table_analysis(table)
+        if "merged_cells" in analysis:
+            return analysis["merged_cells"]
+
+        # 直接遍历 w:tr / w:tc：每个物理单元格只检测一次，列号按 gridSpan 累加（与 row.cells
+        # 的下标一致）；纵向合并的后续单元格在 row.cells 中即上方的起始单元格，已在前面的行处理过
         merged_cells = []
-        for row_idx, row in enumerate(table.rows):
-            for col_idx, cell in enumerate(row.cells):
-                _, _, _, _, merge_info = self._get_cell_span_ultra_enhanced(
-                    cell, table, row_idx, col_idx
+        for row_idx, tr in enumerate(table._tbl.tr_lst):
+            col_idx = 0
+            for tc in tr.tc_lst:
+                start_col = col_idx
+                col_idx += tc.grid_span
+                gridspan, vmerge = _find_cell_merge_marks(tc)
+                if tc.vMerge == "continue" or (gridspan is None and vmerge is None):
+                    continue
+                _, _, _, _, merge_info = self._get_tc_span_ultra_enhanced(
+                    tc,
+                    table,
+                    row_idx,
+                    start_col,
+                    _intern_cell_text(_cell_text(tc).strip()),
                 )
                 if merge_info["merge_type"] != "none":
                     merged_cells.append(merge_info)
+        analysis["merged_cells"] = merged_cells
         return merged_cells
 
     def _get_child_header_ultra_enhanced(
-        self,
-        table: Table,
-        col: int,
-        parent_text: str,
-        header_hierarchy: Dict[int, List[str]],
+        self, col: int, parent_text: str, header_hierarchy: Dict[int, List[str]]
     ) -> str:
         """超增强的子列表头获取方法"""
         column_headers = header_hierarchy.get(col, [])
 
-        # 构建层次结构表头
-        if column_headers:
-            if parent_text not in column_headers:
-                column_headers.insert(0, parent_text)
-            return "/".join(column_headers)
-        else:
+        # 构建层次结构表头（不修改 header_hierarchy 中共享的列表）
+        if not column_headers:
             return parent_text
+        if parent_text and parent_text not in column_headers:
+            return parent_text + "/" + "/".join(column_headers)
+        return "/".join(column_headers)
 
     def _get_single_column_header_ultra_enhanced(
-        self, table: Table, col: int, header_hierarchy: Dict[int, List[str]]
+        self, col: int, header_hierarchy: Dict[int, List[str]]
     ) -> str:
         """超增强的单列表头获取方法"""
         column_headers = header_hierarchy.get(col, [])
@@ -1812,70 +2634,109 @@ class DocFileParser:
     def _validate_header_structure(self, headers: List[str], table: Table) -> bool:
         """验证表头结构的合理性"""
         # 检查表头数量与列数是否匹配
-        if len(headers) != len(table.rows[0].cells):
-            return False
-
-        # 检查表头是否为空（允许部分为空）
-        empty_count = sum(1 for header in headers if not header.strip())
-        if empty_count > len(headers) * 0.5:  # 如果超过50%为空，可能有问题
+        if len(headers) != len(self._get_table_grid(table)["cells"][0]):
             return False
 
-        # 检查表头层次是否合理
+        # 检查表头是否为空（允许部分为空），超过50%为空即可判定，无需数完
+        max_empty = len(headers) * 0.5
+        empty_count = 0
         for header in headers:
-            if header and "/" in header:
-                parts = header.split("/")
-                if len(parts) > 3:  # 层次过多可能有问题
+            if not header or not header.strip():
+                empty_count += 1
+                if empty_count > max_empty:  # 如果超过50%为空，可能有问题
                     return False
 
+        # 检查表头层次是否合理（数分隔符即可，不必拆分成列表）
+        for header in headers:
+            if header and header.count("/") > 2:  # 层次过多可能有问题
+                return False
+
         return True
 
     def _fallback_header_processing(self, table: Table) -> Dict[int, str]:
         """表头处理的回退机制"""
         logger.warning("使用表头处理回退机制")
 
-        # 使用简化的表头处理
-        headers = []
-        for col in range(len(table.rows[0].cells)):
-            if table.rows and col < len(table.rows[0].cells):
-                header = table.rows[0].cells[col].text.strip()
-                headers.append(header)
-            else:
-                headers.append("")
+        # 使用简化的表头处理（首行单元格文本）
+        return dict(enumerate(self._get_table_grid(table)["texts"][0]))
 
-        header_mapping = {}
-        for col, header in enumerate(headers):
-            header_mapping[col] = header
+    def _build_header_mapping_with_fallback(
+        self,
+        table: Table,
+        header_texts: Optional[List[List[str]]] = None,
+        merged_cells: Optional[List[Dict]] = None,
+    ) -> Dict[int, str]:
+        """带回退机制的表头映射构建
 
-        return header_mapping
+        header_texts / merged_cells 可由调用方预先计算后传入，避免重复遍历表格
+        """
+        # 空表格或首行没有单元格时无表头可建，直接返回，不走异常回退
+        cells = self._get_table_grid(table)["cells"]
+        if not cells or not cells[0]:
+            return {}
+        num_cols = len(cells[0])
 
-    def _build_header_mapping_with_fallback(self, table: Table) -> Dict[int, str]:
-        """带回退机制的表头映射构建"""
         try:
             # 尝试使用超增强的方法
-            header_mapping = self._build_header_mapping_ultra_enhanced(table)
-
-            # 验证结果
-            headers = []
-            for col in range(len(table.rows[0].cells)):
-                header = header_mapping.get(col, "")
-                headers.append(header)
-
-            if self._validate_header_structure(headers, table):
-                return header_mapping
-            else:
-                logger.warning("表头结构验证失败，使用回退机制")
-                return self._fallback_header_processing(table)
-
+            header_mapping = self._build_header_mapping_ultra_enhanced(
+                table, header_texts, merged_cells
+            )
         except Exception as e:
             logger.error(f"表头映射构建失败: {str(e)}，使用回退机制")
             return self._fallback_header_processing(table)
 
+        # 验证结果
+        headers = [header_mapping.get(col, "") for col in range(num_cols)]
+        if self._validate_header_structure(headers, table):
+            return header_mapping
+
+        logger.warning("表头结构验证失败，使用回退机制")
+        return self._fallback_header_processing(table)
+
 
 # 加载.env文件，获取API Key
 load_dotenv()
 ZHIPU_API_KEY = os.getenv("ZHIPUAI_API_KEY")
 
 
+def _compile_prompt(template: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    将提示词模板预先解析为 (字面文本, 字段名) 列表，渲染时无需再扫描模板；
+    模板只使用 {字段名} 形式的占位符，不支持格式说明与转换标记
+    """
+    parts = []
+    for literal, field_name, format_spec, conversion in string.Formatter().parse(
+        template
+    ):
+        if format_spec or conversion:
+            raise ValueError(f"提示词模板不支持格式说明: {{{field_name}}}")
+        parts.append((literal, field_name))
+    return parts
+
+
+def _render_prompt(parts: List[Tuple[str, Optional[str]]], fields: Dict) -> str:
+    """按预解析的模板片段拼接提示词，结果与 template.format_map(fields) 相同"""
+    return "".join(
+        [
+            literal if field_name is None else literal + format(fields[field_name])
+            for literal, field_name in parts
+        ]
+    )
+
+
+# 是否带上下文 -> 分块类型 -> 预解析的提示词模板
+_PROMPT_SETS = {
+    with_context: {
+        chunk_type: _compile_prompt(template)
+        for chunk_type, template in prompts.items()
+    }
+    for with_context, prompts in (
+        (True, STRUCTURED_PROMPTS_WITH_CONTEXT),
+        (False, STRUCTURED_PROMPTS),
+    )
+}
+
+
 def build_prompt_for_chunk(chunk: dict, with_context: bool = True) -> str:
     """根据分块类型和元数据动态生成Prompt，支持有无上下文。"""
     chunk_type = chunk.get("type", "text")
@@ -1884,35 +2745,14 @@ def build_prompt_for_chunk(chunk: dict, with_context: bool = True) -> str:
     if chunk.get("metadata", {}).get("is_fragment"):
         chunk_type = "text_fragment"
 
-    if with_context:
-        from utils.chunk_prompts import STRUCTURED_PROMPTS_WITH_CONTEXT as PROMPTS
-    else:
-        from utils.chunk_prompts import STRUCTURED_PROMPTS as PROMPTS
-
-    metadata = chunk.get("metadata", {})
-
-    # 根据chunk类型构建不同的prompt参数
-    if chunk_type == "text_fragment":
-        prompt = PROMPTS.get(chunk_type, PROMPTS["text"]).format(
-            content=chunk.get("content", ""),
-            paragraph_index=metadata.get("paragraph_index", ""),
-            fragment_index=metadata.get("fragment_index", ""),
-            total_fragments=metadata.get("total_fragments", ""),
-            original_content=metadata.get("original_content", ""),
-            context=chunk.get("context", ""),
-        )
-    else:
-        prompt = PROMPTS.get(chunk_type, PROMPTS["text"]).format(
-            content=chunk.get("content", ""),
-            paragraph_index=metadata.get("paragraph_index", ""),
-            table_title=metadata.get("table_title", ""),
-            sheet=metadata.get("sheet", ""),
-            header=metadata.get("header", ""),
-            parent_table_info=metadata.get("parent_table_info", ""),
-            context=chunk.get("context", ""),
-        )
+    PROMPTS = _PROMPT_SETS[bool(with_context)]
+
+    # 模板字段直接取自元数据（缺失字段按空字符串填充），内容与上下文取自chunk本身
+    fields = defaultdict(str, chunk.get("metadata", {}))
+    fields["content"] = chunk.get("content", "")
+    fields["context"] = chunk.get("context", "")
 
-    return prompt
+    return _render_prompt(PROMPTS.get(chunk_type, PROMPTS["text"]), fields)
 
 
 def get_system_prompt_for_chunk(chunk: dict) -> str:
@@ -1927,53 +2767,295 @@ def get_system_prompt_for_chunk(chunk: dict) -> str:
 
 
 async def enhance_chunk(chunk: dict) -> dict:
-    """调用智普API为分块生成description和keywords。"""
+    """调用智普API为分块生成description和keywords（启用LLM缓存时优先读取缓存）。"""
     prompt = build_prompt_for_chunk(chunk)
     system_prompt = get_system_prompt_for_chunk(chunk)
+    cache_key = _enhance_cache_key(system_prompt, prompt)
+    result = await _load_enhance_cache(cache_key)
+    if result is None:
+        response = await zhipu_complete_async(
+            prompt=prompt,
+            api_key=LLM_CONFIG["api_key"],
+            model=LLM_CONFIG["model"],
+            temperature=LLM_CONFIG["temperature"],
+            timeout=LLM_CONFIG["timeout"],
+            max_tokens=LLM_CONFIG["max_tokens"],
+            system_prompt=system_prompt,
+        )
+        result = parse_json_response(response)
+        await _store_enhance_cache(cache_key, result)
+    _apply_enhance_result(chunk, result)
+    return chunk
+
+
+def _enhance_cache_dir() -> str:
+    """分块增强结果的磁盘缓存目录"""
+    cache_dir = LLM_CONFIG["cache_dir"] or os.path.join(
+        os.path.expanduser("~"), ".cache", "tableparser", "llm"
+    )
+    return _ensure_directory(os.path.abspath(cache_dir))
+
+
+def _enhance_cache_key(system_prompt: str, prompt: str) -> str:
+    """增强结果缓存键：模型、系统提示词与Prompt的BLAKE2b摘要"""
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in (LLM_CONFIG["model"], system_prompt, prompt):
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+# 进程内成功写入增强结果缓存的次数，enhance_all_chunks 据此判断是否需要淘汰
+_enhance_cache_writes = 0
+
+
+async def _load_enhance_cache(cache_key: str) -> Optional[dict]:
+    """读取缓存的增强结果（文件读写在线程池中执行），未启用缓存或未命中时返回None"""
+    if not LLM_CONFIG["enable_cache"]:
+        return None
+    return await asyncio.get_running_loop().run_in_executor(
+        None, _read_enhance_cache, cache_key
+    )
+
+
+async def _store_enhance_cache(cache_key: str, result: dict) -> None:
+    """写入增强结果缓存（在线程池中执行）；描述为空（模型输出解析失败）的结果不缓存"""
+    if not LLM_CONFIG["enable_cache"] or not result.get("description"):
+        return
+    await asyncio.get_running_loop().run_in_executor(
+        None, _write_enhance_cache, cache_key, result
+    )
+
+
+def _read_enhance_cache(cache_key: str) -> Optional[dict]:
+    """从磁盘读取缓存的增强结果，未命中时返回None"""
+    cache_path = os.path.join(_enhance_cache_dir(), f"{cache_key}.json")
+    try:
+        # 刷新修改时间（作为LRU淘汰依据），同时判断缓存是否存在
+        os.utime(cache_path)
+        with open(cache_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_enhance_cache(cache_key: str, result: dict) -> None:
+    """将增强结果原子写入磁盘缓存"""
+    global _enhance_cache_writes
+    cache_path = os.path.join(_enhance_cache_dir(), f"{cache_key}.json")
+    # 临时文件名区分进程与线程，并发写入同一键时互不覆盖
+    temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "description": result.get("description", ""),
+                    "keywords": result.get("keywords", []),
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"写入LLM增强缓存失败: {str(e)}")
+        return
+    _enhance_cache_writes += 1
+
+
+def _evict_enhance_cache() -> None:
+    """按修改时间淘汰最久未使用的增强结果缓存，保持数量不超过上限"""
+    try:
+        _evict_cache_dir(_enhance_cache_dir(), ".json", LLM_CONFIG["cache_max_entries"])
+    except OSError as e:
+        logger.warning(f"清理LLM增强缓存失败: {str(e)}")
+
+
+def _needs_llm_enhance(chunk: dict) -> bool:
+    """分块内容是否达到调用LLM增强的最小长度（LLM_CONFIG["min_enhance_chars"]）"""
+    return len(chunk.get("content", "").strip()) >= LLM_CONFIG["min_enhance_chars"]
+
+
+def _apply_enhance_result(chunk: dict, result: dict) -> None:
+    """将模型返回的description和keywords写入分块元数据"""
+    chunk.setdefault("metadata", {})["description"] = result.get("description", "")
+    chunk["metadata"]["keywords"] = result.get("keywords", [])
+
+
+async def enhance_chunk_batch(batch: list[dict]) -> list[dict]:
+    """一次API调用为多个分块生成description和keywords，缺失结果的分块逐个补充增强。"""
+    # 已有缓存结果的分块不再发送，其余分块合并为一次调用
+    keys = [_enhance_cache_key(*_enhance_request_key(chunk)) for chunk in batch]
+    cached_results = await asyncio.gather(*(_load_enhance_cache(key) for key in keys))
+    cache_keys = {}
+    pending = []
+    for chunk, cache_key, result in zip(batch, keys, cached_results):
+        if result is None:
+            cache_keys[id(chunk)] = cache_key
+            pending.append(chunk)
+        else:
+            _apply_enhance_result(chunk, result)
+    if pending:
+        await _enhance_pending_batch(pending, cache_keys)
+    return batch
+
+
+async def _enhance_pending_batch(
+    batch: list[dict], cache_keys: Dict[int, str]
+) -> None:
+    """一次API调用增强 batch 中的分块并写入缓存，缺失结果的分块逐个补充增强"""
+    items = "\n---\n".join(
+        f"[{index}] {build_prompt_for_chunk(chunk)}"
+        for index, chunk in enumerate(batch)
+    )
     response = await zhipu_complete_async(
-        prompt=prompt,
+        prompt=BATCH_STRUCTURED_PROMPT.format(count=len(batch), items=items),
         api_key=LLM_CONFIG["api_key"],
         model=LLM_CONFIG["model"],
         temperature=LLM_CONFIG["temperature"],
         timeout=LLM_CONFIG["timeout"],
         max_tokens=LLM_CONFIG["max_tokens"],
-        system_prompt=system_prompt,
+        system_prompt=BATCH_SYSTEM_PROMPT,
     )
-    result = parse_json_response(response)
-    chunk.setdefault("metadata", {})["description"] = result.get("description", "")
-    chunk["metadata"]["keywords"] = result.get("keywords", [])
-    return chunk
+    results = parse_json_array_response(response)
+
+    # 优先按模型返回的index对应分块，缺少index时按数组顺序对应
+    result_by_index = {}
+    for position, result in enumerate(results):
+        index = result.get("index", position)
+        if isinstance(index, int) and 0 <= index < len(batch):
+            result_by_index.setdefault(index, result)
+
+    missing = []
+    for index, chunk in enumerate(batch):
+        if index in result_by_index:
+            _apply_enhance_result(chunk, result_by_index[index])
+            await _store_enhance_cache(cache_keys[id(chunk)], result_by_index[index])
+        else:
+            missing.append(chunk)
+    if missing:
+        logger.warning(
+            f"批量增强结果缺失 {len(missing)}/{len(batch)} 个分块，逐个补充增强"
+        )
+        # 调用方持有一个信号量名额，缺失的分块在该名额内逐个增强，不突破并发上限
+        for chunk in missing:
+            await enhance_chunk(chunk)
+
 
+def _enhance_request_key(chunk: dict) -> Tuple[str, str]:
+    """分块增强请求的去重键：系统提示词与Prompt均相同的分块，增强请求完全相同"""
+    return get_system_prompt_for_chunk(chunk), build_prompt_for_chunk(chunk)
 
-async def enhance_all_chunks(chunks: list[dict]) -> list[dict]:
-    """批量异步增强所有分块，只对分片text块和表格块进行增强"""
+
+async def enhance_all_chunks(
+    chunks: list[dict], semaphore: Optional[asyncio.Semaphore] = None
+) -> list[dict]:
+    """
+    批量异步增强所有分块，只对分片text块和表格块进行增强。
+    semaphore 用于多个文档共用LLM并发上限，未传入时按 LLM_CONFIG["max_async"] 新建
+    """
     # 过滤出需要增强的分块：
     # 1. 表格块（table_full和table_row）始终增强
     # 2. 分片text块需要增强
     # 3. 非分片text块不增强
     # 4. 图片块不增强
-    chunks_to_enhance = [
-        chunk
-        for chunk in chunks
-        if (
-            # 表格块始终增强
-            chunk.get("type") in ["table_full", "table_row"]
-            or
-            # 分片text块需要增强
-            (
-                chunk.get("type") == "text"
-                and chunk.get("metadata", {}).get("is_fragment")
+    cache_writes_before = _enhance_cache_writes
+    chunks_to_enhance = []
+    non_enhanced_chunks = []
+    for chunk in chunks:
+        chunk_type = chunk.get("type")
+        if chunk_type in ("table_full", "table_row") or (
+            chunk_type == "text" and chunk.get("metadata", {}).get("is_fragment")
+        ):
+            chunks_to_enhance.append(chunk)
+        else:
+            non_enhanced_chunks.append(chunk)
+
+    # 内容过短的分块（空表头、一两个字符的单元格等）不调用LLM，直接以内容作为描述
+    chunks_to_request = []
+    skipped_count = 0
+    for chunk in chunks_to_enhance:
+        if _needs_llm_enhance(chunk):
+            chunks_to_request.append(chunk)
+        else:
+            _apply_enhance_result(
+                chunk, {"description": chunk.get("content", "").strip()[:80]}
             )
+            skipped_count += 1
+    if skipped_count:
+        logger.info(f"{skipped_count} 个分块内容过短，跳过LLM增强")
+
+    # 请求完全相同的分块（如重复的表格行）只调用一次LLM，结果再复制给重复的分块
+    unique_chunks = {}
+    duplicate_chunks = []
+    for chunk in chunks_to_request:
+        representative = unique_chunks.setdefault(_enhance_request_key(chunk), chunk)
+        if representative is not chunk:
+            duplicate_chunks.append((chunk, representative))
+    if duplicate_chunks:
+        logger.info(
+            f"{len(duplicate_chunks)} 个分块与其他分块的增强请求相同，复用增强结果"
         )
-    ]
+    chunks_to_call = list(unique_chunks.values())
 
     # 只对符合条件的块进行增强
-    tasks = [enhance_chunk(chunk) for chunk in chunks_to_enhance]
-    enhanced_chunks = await asyncio.gather(*tasks)
+    # 用信号量限制同时进行的LLM调用数（LLM_CONFIG["max_async"]），避免大量并发请求触发限流重试
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, LLM_CONFIG["max_async"]))
+    batch_size = LLM_CONFIG["enhance_batch_size"]
+
+    if batch_size > 1:
+        # 每次调用合并 batch_size 个分块，减少网络往返和重复的提示词前缀
+        async def enhance_batch_with_limit(batch: list[dict]) -> list[dict]:
+            async with semaphore:
+                return await enhance_chunk_batch(batch)
+
+        # 按系统提示词（即分块类型）分组后再切分批次，同一批次内的分块分析要求一致
+        chunks_by_type: Dict[str, list[dict]] = {}
+        for chunk in chunks_to_call:
+            chunks_by_type.setdefault(get_system_prompt_for_chunk(chunk), []).append(
+                chunk
+            )
+        task_chunks = [
+            group[start : start + batch_size]
+            for group in chunks_by_type.values()
+            for start in range(0, len(group), batch_size)
+        ]
+        tasks = [enhance_batch_with_limit(batch) for batch in task_chunks]
+    else:
+
+        async def enhance_with_limit(chunk: dict) -> dict:
+            async with semaphore:
+                return await enhance_chunk(chunk)
+
+        task_chunks = [[chunk] for chunk in chunks_to_call]
+        tasks = [enhance_with_limit(chunk) for chunk in chunks_to_call]
+
+    # 单个分块（批次）增强失败只记录日志、保留原分块，不影响其余分块；
+    # 网络错误的重试（指数退避）已在 zhipu_complete_async 中完成
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = [
+        (batch, result)
+        for batch, result in zip(task_chunks, results)
+        if isinstance(result, Exception)
+    ]
+    for batch, error in failures:
+        chunk_ids = ", ".join(str(chunk.get("chunk_id")) for chunk in batch)
+        logger.error(f"分块增强失败，保持未增强 [{chunk_ids}]: {error!r}")
+    if failures:
+        logger.error(f"{len(failures)}/{len(tasks)} 个增强请求失败")
+
+    # 只有本次调用期间写入过新的缓存条目时才淘汰，扫描目录放到线程池执行
+    if _enhance_cache_writes != cache_writes_before:
+        await asyncio.get_running_loop().run_in_executor(None, _evict_enhance_cache)
+
+    for chunk, representative in duplicate_chunks:
+        metadata = representative.get("metadata", {})
+        if "description" in metadata:
+            chunk.setdefault("metadata", {})["description"] = metadata["description"]
+            chunk["metadata"]["keywords"] = list(metadata.get("keywords", []))
 
-    # 将非增强的块和增强后的块合并
-    non_enhanced_chunks = [chunk for chunk in chunks if chunk not in chunks_to_enhance]
-    return enhanced_chunks + non_enhanced_chunks
+    # 增强结果已直接写入各分块的元数据，将增强的块和非增强的块合并
+    return chunks_to_enhance + non_enhanced_chunks
 
 
 # 示例主流程（可根据实际集成位置调整）
@@ -1983,8 +3065,8 @@ if __name__ == "__main__":
     test_file = "test_data/sample.docx"  # 替换为实际文件路径
 
     if os.path.exists(test_file):
-        chunks = parser.process(test_file)
-        enhanced_chunks = asyncio.run(enhance_all_chunks(chunks))
+        # process 为协程，解析完成后已包含LLM增强
+        enhanced_chunks = asyncio.run(parser.process(test_file))
         logger.info(f"处理完成，共生成 {len(enhanced_chunks)} 个增强分块")
     else:
         logger.info("测试文件不存在，跳过示例执行")
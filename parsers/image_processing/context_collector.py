@@ -41,40 +41,90 @@ class ContextCollector:
         try:
             # 找到图片块在all_blocks中的位置
             image_index = all_blocks.index(image_block)
+            return self._build_context(
+                image_index, all_blocks, self.get_document_title(all_blocks)
+            )
 
-            # 收集前文
-            preceding_blocks = []
-            for i in range(max(0, image_index - self.context_window), image_index):
-                if all_blocks[i]["type"] == "text":
-                    preceding_blocks.append(all_blocks[i]["content"])
-
-            # 收集后文
-            following_blocks = []
-            for i in range(
-                image_index + 1,
-                min(len(all_blocks), image_index + self.context_window + 1),
-            ):
-                if all_blocks[i]["type"] == "text":
-                    following_blocks.append(all_blocks[i]["content"])
-
-            context = {
-                "preceding": " ".join(preceding_blocks),
-                "following": " ".join(following_blocks),
-                "document_title": self.get_document_title(all_blocks),
-                "image_position": f"第{image_index + 1}个内容块",
-            }
-
-            logger.debug(f"为图片收集上下文: {context}")
-            return context
+        except Exception as e:
+            logger.error(f"上下文收集失败: {str(e)}")
+            return self._empty_context()
+
+    def collect_contexts_for_images(
+        self, image_blocks: List[Dict], all_blocks: List[Dict]
+    ) -> List[Dict]:
+        """
+        为多个图片批量收集上下文信息，结果与逐个调用 collect_context_for_image 相同
+
+        文档标题只提取一次，图片块位置通过一次遍历建立的索引查找，
+        避免每张图片都线性扫描 all_blocks
+
+        Args:
+            image_blocks: 图片块字典列表（均为 all_blocks 中的元素）
+            all_blocks: 所有文档块列表
 
+        Returns:
+            与 image_blocks 一一对应的上下文信息字典列表
+        """
+        try:
+            document_title = self.get_document_title(all_blocks)
+            position_by_id = {}
+            for index, block in enumerate(all_blocks):
+                position_by_id.setdefault(id(block), index)
         except Exception as e:
             logger.error(f"上下文收集失败: {str(e)}")
-            return {
-                "preceding": "",
-                "following": "",
-                "document_title": "",
-                "image_position": "",
-            }
+            return [self._empty_context() for _ in image_blocks]
+
+        contexts = []
+        for image_block in image_blocks:
+            try:
+                image_index = position_by_id.get(id(image_block))
+                if image_index is None:
+                    image_index = all_blocks.index(image_block)
+                contexts.append(
+                    self._build_context(image_index, all_blocks, document_title)
+                )
+            except Exception as e:
+                logger.error(f"上下文收集失败: {str(e)}")
+                contexts.append(self._empty_context())
+        return contexts
+
+    def _build_context(
+        self, image_index: int, all_blocks: List[Dict], document_title: str
+    ) -> Dict:
+        """根据图片块位置收集前后文本块，组装上下文字典"""
+        # 收集前文
+        preceding_blocks = []
+        for i in range(max(0, image_index - self.context_window), image_index):
+            if all_blocks[i]["type"] == "text":
+                preceding_blocks.append(all_blocks[i]["content"])
+
+        # 收集后文
+        following_blocks = []
+        for i in range(
+            image_index + 1,
+            min(len(all_blocks), image_index + self.context_window + 1),
+        ):
+            if all_blocks[i]["type"] == "text":
+                following_blocks.append(all_blocks[i]["content"])
+
+        context = {
+            "preceding": " ".join(preceding_blocks),
+            "following": " ".join(following_blocks),
+            "document_title": document_title,
+            "image_position": f"第{image_index + 1}个内容块",
+        }
+
+        logger.debug(f"为图片收集上下文: {context}")
+        return context
+
+    def _empty_context(self) -> Dict:
+        """上下文收集失败时返回的空上下文"""
+        return {
+            "preceding": "",
+            "following": "",
+            "document_title": "",
+            "image_position": "",
+        }
 
     def get_document_title(self, all_blocks: List[Dict]) -> str:
         """
@@ -166,6 +166,86 @@ class ImageExtractor:
             logger.warning(f"表格单元格图片定位失败，已跳过：{e}")
         return results
 
+    # --------- 新增：定位方法（整表一次查询） ---------
+    def discover_images_in_table(
+        self, table
+    ) -> List["ImageExtractor.TableCellImageRef"]:
+        """
+        对整个表格执行一次 XPath 查询发现单元格内图片，按行、列、单元格内顺序排列。
+
+        与逐个 row.cells 调用 discover_images_in_table_cell 的结果一致：
+        - col_index 为网格列下标（横向合并单元格按其起始列计）
+        - 纵向合并的延续单元格（vMerge=continue）不含内容，跳过
+        - 仅统计单元格直属段落中的图片，嵌套表格中的图片不计入
+
+        Returns: List of { rel_id, row_index, col_index, order_in_cell }
+        """
+        results: List[ImageExtractor.TableCellImageRef] = []
+        try:
+            tbl = table._tbl
+            w_p, w_tc, w_tr = qn("w:p"), qn("w:tc"), qn("w:tr")
+            w_tcPr, w_gridSpan, w_vMerge = qn("w:tcPr"), qn("w:gridSpan"), qn("w:vMerge")
+            w_val = qn("w:val")
+            # 行下标：表格直属的 w:tr
+            row_indexes = {
+                tr: r_idx
+                for r_idx, tr in enumerate(
+                    child for child in tbl.iterchildren() if child.tag == w_tr
+                )
+            }
+            # 单元格 -> (行下标, 网格列下标)，跳过纵向合并的延续单元格
+            cell_positions = {}
+            for tr, r_idx in row_indexes.items():
+                grid_col = 0
+                for tc in tr.iterchildren(w_tc):
+                    tc_pr = tc.find(w_tcPr)
+                    span = 1
+                    is_continue = False
+                    if tc_pr is not None:
+                        grid_span = tc_pr.find(w_gridSpan)
+                        if grid_span is not None:
+                            span = int(grid_span.get(w_val, 1))
+                        v_merge = tc_pr.find(w_vMerge)
+                        if v_merge is not None:
+                            is_continue = v_merge.get(w_val, "continue") == "continue"
+                    if not is_continue:
+                        cell_positions[tc] = (r_idx, grid_col)
+                    grid_col += span
+
+            nodes = tbl.xpath(
+                ".//*[local-name()='drawing']//*[local-name()='blip'] | .//*[local-name()='pict']//*[local-name()='imagedata']"
+            )
+            order_in_cells: Dict[object, int] = {}
+            for node in nodes:
+                # 图片所在段落必须是本表格单元格的直属段落
+                p = next(node.iterancestors(w_p), None)
+                if p is None:
+                    continue
+                tc = p.getparent()
+                position = cell_positions.get(tc)
+                if position is None:
+                    continue
+                if node.tag.endswith("blip"):
+                    rel_id = node.get(qn("r:embed"))
+                else:
+                    rel_id = node.get(qn("r:id"))
+                if not rel_id:
+                    continue
+                order = order_in_cells.get(tc, 0)
+                order_in_cells[tc] = order + 1
+                results.append(
+                    {
+                        "rel_id": rel_id,
+                        "row_index": position[0],
+                        "col_index": position[1],
+                        "order_in_cell": order,
+                    }
+                )
+            results.sort(key=lambda item: (item["row_index"], item["col_index"]))
+        except Exception as e:
+            logger.warning(f"表格图片定位失败，已跳过：{e}")
+        return results
+
     # --------- 新增：保存与去重 ---------
     def get_or_save_by_rel(
         self, document, rel_id: str, doc_id: str, image_index: int
@@ -33,7 +33,44 @@ class XlsxFileParser:
     def parse(self, file_path: str) -> List[Dict]:
         """
         解析Excel文件，输出分块结构，每个分块包含type、content、metadata、context、parent_id。
+        同步入口，已在事件循环中的调用方应直接 await parse_async。
         """
+        return asyncio.run(self.parse_async(file_path))
+
+    async def parse_async(self, file_path: str) -> List[Dict]:
+        """
+        异步解析Excel文件：先解析出全部分块，再调用LLM增强。
+        """
+        all_chunks = self._parse_chunks(file_path)
+        if not all_chunks:
+            return all_chunks
+
+        # 调用LLM增强所有分块
+        try:
+            enhanced_chunks = await enhance_all_chunks(all_chunks)
+
+            # 统计增强的块类型
+            enhanced_table_chunks = [
+                chunk
+                for chunk in enhanced_chunks
+                if chunk.get("type") in ["table_full", "table_row"]
+            ]
+            enhanced_fragment_chunks = [
+                chunk
+                for chunk in enhanced_chunks
+                if chunk.get("type") == "text"
+                and chunk.get("metadata", {}).get("is_fragment")
+            ]
+            logger.info(
+                f"成功增强 {len(enhanced_chunks)} 个分块（表格块：{len(enhanced_table_chunks)}，分片文本块：{len(enhanced_fragment_chunks)}）"
+            )
+            return enhanced_chunks
+        except Exception as e:
+            logger.error(f"LLM增强分块失败: {str(e)}")
+            return all_chunks  # 如果增强失败，返回原始分块
+
+    def _parse_chunks(self, file_path: str) -> List[Dict]:
+        """解析Excel文件中的全部表格分块（不含LLM增强）"""
         logger.info(f"开始解析Excel文档: {file_path}")
         if not os.path.exists(file_path):
             logger.error(f"文件不存在: {file_path}")
@@ -127,43 +164,7 @@ class XlsxFileParser:
         for idx, chunk in enumerate(all_chunks):
             chunk["chunk_id"] = f"{doc_id}_{idx+1}"
 
-        # 调用LLM增强所有分块
-        try:
-            import asyncio
-            import nest_asyncio
-
-            # 应用nest_asyncio以支持嵌套事件循环
-            nest_asyncio.apply()
-
-            # 检查是否已有运行的事件循环
-            try:
-                loop = asyncio.get_running_loop()
-                # 如果已有事件循环，创建任务
-                task = loop.create_task(enhance_all_chunks(all_chunks))
-                enhanced_chunks = loop.run_until_complete(task)
-            except RuntimeError:
-                # 如果没有运行的事件循环，使用asyncio.run
-                enhanced_chunks = asyncio.run(enhance_all_chunks(all_chunks))
-
-            # 统计增强的块类型
-            enhanced_table_chunks = [
-                chunk
-                for chunk in enhanced_chunks
-                if chunk.get("type") in ["table_full", "table_row"]
-            ]
-            enhanced_fragment_chunks = [
-                chunk
-                for chunk in enhanced_chunks
-                if chunk.get("type") == "text"
-                and chunk.get("metadata", {}).get("is_fragment")
-            ]
-            logger.info(
-                f"成功增强 {len(enhanced_chunks)} 个分块（表格块：{len(enhanced_table_chunks)}，分片文本块：{len(enhanced_fragment_chunks)}）"
-            )
-            return enhanced_chunks
-        except Exception as e:
-            logger.error(f"LLM增强分块失败: {str(e)}")
-            return all_chunks  # 如果增强失败，返回原始分块
+        return all_chunks
 
     def _convert_table_to_format(
         self,
@@ -611,11 +612,14 @@ class XlsxFileParser:
 
     def _row_to_html(self, row: pd.Series, headers: List[str]) -> str:
         """将单行转为HTML表格。"""
-        html = "<table border='1'><tr>"
-        for cell in row:
-            html += f"<td>{str(cell) if pd.notna(cell) else '-'}</td>"
-        html += "</tr></table>"
-        return html
+        if row.empty:
+            return "<table border='1'><tr></tr></table>"
+        # 单元格之间以 "</td><td>" 一次性拼接，不在循环中逐个累加字符串
+        return (
+            "<table border='1'><tr><td>"
+            + "</td><td>".join([str(cell) if pd.notna(cell) else "-" for cell in row])
+            + "</td></tr></table>"
+        )
 
     def _row_to_markdown(self, row: pd.Series, headers: List[str]) -> str:
         """将单行转为Markdown表格。"""
@@ -757,25 +761,38 @@ async def enhance_all_chunks(chunks: List[Dict]) -> List[Dict]:
     # 1. 表格块（table_full和table_row）始终增强
     # 2. 分片text块需要增强
     # 3. 非分片text块不增强
-    chunks_to_enhance = [
-        chunk
-        for chunk in chunks
-        if (
-            # 表格块始终增强
-            chunk.get("type") in ["table_full", "table_row"]
-            or
-            # 分片text块需要增强
-            (
-                chunk.get("type") == "text"
-                and chunk.get("metadata", {}).get("is_fragment")
-            )
-        )
-    ]
+    chunks_to_enhance = []
+    non_enhanced_chunks = []
+    for chunk in chunks:
+        chunk_type = chunk.get("type")
+        if chunk_type in ("table_full", "table_row") or (
+            chunk_type == "text" and chunk.get("metadata", {}).get("is_fragment")
+        ):
+            chunks_to_enhance.append(chunk)
+        else:
+            non_enhanced_chunks.append(chunk)
 
     # 只对符合条件的块进行增强
-    tasks = [enhance_chunk(chunk) for chunk in chunks_to_enhance]
-    enhanced_chunks = await asyncio.gather(*tasks)
+    # 用信号量限制同时进行的LLM调用数（LLM_CONFIG["max_async"]），避免大量并发请求触发限流重试
+    semaphore = asyncio.Semaphore(max(1, LLM_CONFIG["max_async"]))
+
+    async def enhance_with_limit(chunk: Dict) -> Dict:
+        async with semaphore:
+            return await enhance_chunk(chunk)
+
+    tasks = [enhance_with_limit(chunk) for chunk in chunks_to_enhance]
+
+    # 单个分块增强失败只记录日志、保留原分块，不影响其余分块
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = [
+        (chunk, result)
+        for chunk, result in zip(chunks_to_enhance, results)
+        if isinstance(result, Exception)
+    ]
+    for chunk, error in failures:
+        logger.error(f"分块增强失败，保持未增强 [{chunk.get('chunk_id')}]: {error!r}")
+    if failures:
+        logger.error(f"{len(failures)}/{len(tasks)} 个增强请求失败")
 
-    # 将非增强的块和增强后的块合并
-    non_enhanced_chunks = [chunk for chunk in chunks if chunk not in chunks_to_enhance]
-    return enhanced_chunks + non_enhanced_chunks
+    # 增强结果已直接写入各分块的元数据，将增强的块和非增强的块合并
+    return chunks_to_enhance + non_enhanced_chunks
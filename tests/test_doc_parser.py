@@ -1,4 +1,6 @@
+import asyncio
 import os
+from docx import Document
 from parsers.doc_parser import DocFileParser
 from parsers.fragment_config import FragmentConfig, TableProcessingConfig
 
@@ -13,7 +15,7 @@ def test_docx_without_fragmentation():
     
     parser = DocFileParser(fragment_config=FragmentConfig(table_processing=table_config))
     input_path = os.path.join(os.path.dirname(__file__), "../test_data/testData.docx")
-    result = parser.process(input_path)
+    result = asyncio.run(parser.process(input_path))
     output_path = os.path.join(
         os.path.dirname(__file__), "../test_data/test_docx_result_no_frag.json"
     )
@@ -42,7 +44,7 @@ def test_docx_with_fragmentation():
     
     parser = DocFileParser(fragment_config=config)
     input_path = os.path.join(os.path.dirname(__file__), "../test_data/testData1.docx")
-    result = parser.process(input_path)
+    result = asyncio.run(parser.process(input_path))
     output_path = os.path.join(
         os.path.dirname(__file__), "../test_data/test_docx_md_result_with_frag.json"
     )
@@ -63,7 +65,7 @@ def test_doc_without_fragmentation():
     
     parser = DocFileParser(fragment_config=FragmentConfig(table_processing=table_config))
     input_path = os.path.join(os.path.dirname(__file__), "../test_data/testData.doc")
-    result = parser.process(input_path)
+    result = asyncio.run(parser.process(input_path))
     output_path = os.path.join(
         os.path.dirname(__file__), "../test_data/test_doc_result_no_frag.json"
     )
@@ -92,7 +94,7 @@ def test_doc_with_fragmentation():
     
     parser = DocFileParser(fragment_config=config)
     input_path = os.path.join(os.path.dirname(__file__), "../test_data/testData.doc")
-    result = parser.process(input_path)
+    result = asyncio.run(parser.process(input_path))
     output_path = os.path.join(
         os.path.dirname(__file__), "../test_data/test_doc_result_with_frag1.json"
     )
@@ -116,7 +118,7 @@ def test_fragmentation_comparison():
         table_chunking_strategy="full_only"
     )
     parser_no_frag = DocFileParser(fragment_config=FragmentConfig(table_processing=table_config))
-    result_no_frag = parser_no_frag.process(input_path)
+    result_no_frag = asyncio.run(parser_no_frag.process(input_path))
     
     # 有分片
     config = FragmentConfig(
@@ -127,7 +129,7 @@ def test_fragmentation_comparison():
         table_processing=table_config
     )
     parser_with_frag = DocFileParser(fragment_config=config)
-    result_with_frag = parser_with_frag.process(input_path)
+    result_with_frag = asyncio.run(parser_with_frag.process(input_path))
     
     print(f"无分片结果: {len(result_no_frag)} 个chunks")
     print(f"有分片结果: {len(result_with_frag)} 个chunks")
@@ -151,6 +153,63 @@ def test_fragmentation_comparison():
         print(f"表格内容预览: {table_chunks[0].get('content', '')[:100]}...")
 
 
+def _build_merged_table():
+    """构造含特殊字符及横纵双向合并单元格（gridSpan + vMerge）的表格"""
+    table = Document().add_table(rows=4, cols=3)
+    # 左上角2x2合并为一个单元格，表头其余单元格与表体含HTML/Markdown特殊字符
+    table.cell(0, 0).merge(table.cell(1, 1)).text = "a<b&c"
+    table.cell(0, 2).text = "x|y"
+    table.cell(1, 2).text = "情况"
+    for row_idx, values in enumerate([["1", "2", "3"], ["4>5", "p|q", "6"]], start=2):
+        for col_idx, value in enumerate(values):
+            table.cell(row_idx, col_idx).text = value
+    return table
+
+
+def _convert_merged_table(table_format):
+    """按指定格式转换合并表格，返回完整表格块"""
+    table_config = TableProcessingConfig(
+        table_format=table_format,
+        table_chunking_strategy="full_only"
+    )
+    parser = DocFileParser(fragment_config=FragmentConfig(table_processing=table_config))
+    return parser._split_table_with_merge(_build_merged_table(), "doc", None, None)[0]
+
+
+def test_table_cells_escaped_in_html():
+    """HTML表格的表头（含合并表头）与表体单元格转义 <、&、>，元数据保留原文"""
+    chunk = _convert_merged_table("html")
+    content = chunk["content"]
+    assert '<th colspan="2">a&lt;b&amp;c</th>' in content
+    assert "<td>4&gt;5</td>" in content
+    assert "a<b&c" not in content and "4>5" not in content
+    assert any("x|y" in header for header in chunk["metadata"]["header"])
+    assert chunk["metadata"]["merged_cells"][0]["text"] == "a<b&c"
+
+
+def test_table_cells_escaped_in_markdown():
+    """Markdown表格的表头与表体单元格转义竖线，元数据保留原文"""
+    chunk = _convert_merged_table("markdown")
+    lines = chunk["content"].splitlines()
+    assert "x\\|y" in lines[0] and "a<b&c" in lines[0]
+    assert lines[-1] == "| 4>5 | p\\|q | 6 |"
+    assert any("x|y" in header for header in chunk["metadata"]["header"])
+
+
+def test_merged_cell_recorded_once():
+    """横纵双向合并的单元格只记录一条合并信息，不再为相邻列生成多余的父表头"""
+    chunk = _convert_merged_table("html")
+    merged_cells = chunk["metadata"]["merged_cells"]
+    assert len(merged_cells) == 1
+    assert merged_cells[0]["row"] == 0 and merged_cells[0]["col"] == 0
+    assert merged_cells[0]["colspan"] == 2
+    # 重复的合并记录曾使第3列表头带上合并单元格的文本（"a<b&c/x|y/情况"）
+    assert chunk["metadata"]["header"][2] == "x|y/情况"
+    assert "a<b&c/x|y" not in chunk["metadata"]["parent_table_info"]
+    # 每个表头行只输出一个带colspan的合并表头
+    assert chunk["content"].count('<th colspan="2">') == 2
+
+
 def test_doc():
     """兼容原有测试函数"""
     test_doc_without_fragmentation()
@@ -16,6 +16,22 @@ SYSTEM_PROMPTS: Dict[str, str] = {
     # "future_type": "..."
 }
 
+# 批量增强的系统提示词与Prompt（多个分块合并为一次API调用）
+BATCH_SYSTEM_PROMPT = (
+    "你是一名专业的内容与数据分析师，请按编号逐一分析下方的多个分块（文本分片、表格或表格行），"
+    "分别给出简明、准确的分析和总结。"
+)
+
+BATCH_STRUCTURED_PROMPT = (
+    "下面共有{count}个分块，每个分块以“[编号]”开头、以“---”分隔，并附有各自的分析要求。\n"
+    "请按各分块的要求分别分析，并按编号顺序输出一个JSON数组，每个分块对应一个元素：\n"
+    "[\n"
+    '  {{"index": 0, "description": "该分块的描述", "keywords": ["关键词1", "关键词2"]}}\n'
+    "]\n"
+    "只输出JSON数组，不要其他内容。\n\n"
+    "{items}"
+)
+
 # 结构化输出Prompt（用于API调用生成description/keywords）
 STRUCTURED_PROMPTS: Dict[str, str] = {
     "text": (
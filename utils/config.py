@@ -5,11 +5,18 @@ load_dotenv()
 
 LLM_CONFIG = {
     "enable_cache": os.getenv("ENABLE_LLM_CACHE", "false").lower() == "true",
+    # 分块增强结果的磁盘缓存目录（为空时使用 ~/.cache/tableparser/llm）及缓存条目上限
+    "cache_dir": os.getenv("LLM_CACHE_DIR", ""),
+    "cache_max_entries": int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")),
     "enable_cache_extract": os.getenv("ENABLE_LLM_CACHE_FOR_EXTRACT", "false").lower()
     == "true",
     "timeout": int(os.getenv("TIMEOUT", "60")),
     "temperature": float(os.getenv("TEMPERATURE", "0")),
     "max_async": int(os.getenv("MAX_ASYNC", "4")),
+    # 分块增强时每次LLM调用合并的分块数，1表示逐块调用
+    "enhance_batch_size": int(os.getenv("ENHANCE_BATCH_SIZE", "1")),
+    # 内容（去除首尾空白后）短于该字符数的分块不调用LLM，直接以内容作为描述，0表示不跳过
+    "min_enhance_chars": int(os.getenv("ENHANCE_MIN_CHARS", "0")),
     "max_tokens": int(os.getenv("MAX_TOKENS", "2048")),
     "binding": os.getenv("LLM_BINDING", "openai"),
     "model": os.getenv("LLM_MODEL", "glm-4-plus"),
@@ -35,3 +42,25 @@ VISION_CONFIG = {
     "cache_enabled": os.getenv("VISION_CACHE_ENABLED", "true").lower() == "true",
     "cache_ttl": int(os.getenv("VISION_CACHE_TTL", "3600")),
 }
+
+DOC_PARSER_CONFIG = {
+    # DOCX解析进程池大小，0（默认）表示在事件循环线程内直接解析
+    "parse_workers": int(os.getenv("DOC_PARSE_WORKERS", "0")),
+}
+
+LIBREOFFICE_CONFIG = {
+    "listener_enabled": os.getenv("LIBREOFFICE_LISTENER_ENABLED", "true").lower()
+    == "true",
+    "pool_size": int(os.getenv("LIBREOFFICE_POOL_SIZE", "2")),
+    "base_port": int(os.getenv("LIBREOFFICE_BASE_PORT", "2002")),
+    "startup_timeout": int(os.getenv("LIBREOFFICE_STARTUP_TIMEOUT", "30")),
+    "batch_window": float(os.getenv("LIBREOFFICE_BATCH_WINDOW", "0.05")),
+    "max_batch_size": int(os.getenv("LIBREOFFICE_MAX_BATCH_SIZE", "16")),
+    # DOC转换结果缓存（按文件内容哈希），目录为空时使用 ~/.cache/tableparser/doc_conversion
+    "cache_enabled": os.getenv("DOC_CONVERSION_CACHE_ENABLED", "true").lower()
+    == "true",
+    "cache_dir": os.getenv("DOC_CONVERSION_CACHE_DIR", ""),
+    "cache_max_entries": int(os.getenv("DOC_CONVERSION_CACHE_MAX_ENTRIES", "256")),
+    # 未启用缓存时转换输出的临时目录，为空时Linux优先使用内存文件系统 /dev/shm
+    "temp_dir": os.getenv("DOC_CONVERSION_TEMP_DIR", ""),
+}
@@ -4,6 +4,7 @@ import json
 import logging
 import asyncio
 import base64
+import functools
 from typing import List, Dict, Optional, Union
 from tenacity import (
     retry,
@@ -68,13 +69,18 @@ async def zhipu_complete_async(
         final_messages.append({"role": "user", "content": prompt})
     
     logger.debug(f"ZhipuAI request with {len(final_messages)} messages")
-    response = client.chat.completions.create(
-        model=model,
-        messages=final_messages,
-        temperature=temperature,
-        timeout=timeout,
-        max_tokens=max_tokens,
-        **kwargs,
+    # SDK为同步阻塞调用，放到线程池执行，避免阻塞事件循环、使并发请求真正并行
+    response = await asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(
+            client.chat.completions.create,
+            model=model,
+            messages=final_messages,
+            temperature=temperature,
+            timeout=timeout,
+            max_tokens=max_tokens,
+            **kwargs,
+        ),
     )
     return response.choices[0].message.content
 
@@ -94,6 +100,24 @@ def parse_json_response(response: str) -> Dict[str, Union[str, List[str]]]:
         return {"description": "", "keywords": []}
 
 
+def parse_json_array_response(response: str) -> List[Dict]:
+    """健壮解析模型输出为JSON数组（批量增强结果），失败时返回空列表。"""
+    try:
+        result = json.loads(response)
+    except json.JSONDecodeError:
+        result = None
+        match = re.search(r"\[[\s\S]*\]", response)
+        if match:
+            try:
+                result = json.loads(match.group())
+            except json.JSONDecodeError:
+                pass
+    if not isinstance(result, list):
+        logger.warning(f"Failed to parse JSON array from response: {response}")
+        return []
+    return [item for item in result if isinstance(item, dict)]
+
+
 def get_prompt_for_chunk(chunk_type: str, content: str) -> str:
     """根据分块类型生成合适的Prompt。"""
     if chunk_type == "table_full":
@@ -128,10 +152,14 @@ async def zhipu_embedding_async(
     client = ZhipuAI(api_key=api_key)
     logger.debug(f"ZhipuAI embedding request for text length: {len(text)}")
 
-    response = client.embeddings.create(
-        model=model,
-        input=text,
-        **kwargs,
+    response = await asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(
+            client.embeddings.create,
+            model=model,
+            input=text,
+            **kwargs,
+        ),
     )
 
     # 返回嵌入向量